@@ -0,0 +1,198 @@
+import time
+import asyncio
+import logging
+
+from lib.xgs600 import XGS600Protocol
+
+
+class TCPTransport:
+    """
+    asyncio stream to one TCP instrument, responses are framed on terminator.
+    Requests on one transport are serialized by a lock, requests to different
+    transports run concurrently on the same event loop. Like lib/transport.py, the replies
+    still owed by a timed out request are read and dropped before the next one is sent.
+    """
+
+    def __init__(self, ip: str, port: int, terminator: bytes = b'\r', timeout: float = 1.) -> None:
+        self.ip = ip
+        self.port = port
+        self.terminator = terminator
+        self.timeout = timeout
+        self.__reader = None
+        self.__writer = None
+        self.__lock = asyncio.Lock()
+        self.__owed = 0  # replies of timed out requests
+
+    async def open(self) -> None:
+        self.__reader, self.__writer = await asyncio.wait_for(
+            asyncio.open_connection(self.ip, self.port), self.timeout)
+        self.__owed = 0
+
+    async def close(self) -> None:
+        self.__writer.close()
+        await self.__writer.wait_closed()
+
+    async def read_frame(self, timeout: float = None) -> bytes:
+        return await asyncio.wait_for(self.__reader.readuntil(self.terminator), timeout or self.timeout)
+
+    async def __resync(self) -> None:
+        if self.__owed:
+            deadline = time.perf_counter() + self.timeout * self.__owed
+            try:
+                for _ in range(self.__owed):
+                    await self.read_frame(max(deadline - time.perf_counter(), 1e-3))
+            except asyncio.TimeoutError:
+                pass
+            self.__owed = 0
+
+    async def query_many(self, cmds: list[bytes], timeout: float = None) -> list[bytes]:
+        # written back-to-back, one deadline for all frames
+        async with self.__lock:
+            await self.__resync()
+            self.__writer.write(b''.join(cmds))
+            await self.__writer.drain()
+            deadline = time.perf_counter() + (timeout or self.timeout) * len(cmds)
+            frames = []
+            try:
+                for _ in cmds:
+                    frames.append(await self.read_frame(max(deadline - time.perf_counter(), 1e-3)))
+            except asyncio.TimeoutError:
+                self.__owed = len(cmds) - len(frames)
+                raise
+            return frames
+
+    async def query(self, cmd: bytes, timeout: float = None) -> bytes:
+        return (await self.query_many([cmd], timeout))[0]
+
+
+class AsyncDL7:
+    """
+    DL7 streams 'N.N E - N Pa\\r' frames on its own, a reader task keeps the latest one.
+    When the stream stops or the connection drops, the reading goes stale (get_pressure()
+    raises) and a lost connection is reopened with exponential backoff.
+    """
+
+    def __init__(self, ip: str = '192.168.30.131', port: int = 8234, timeout: float = 2.,
+                 max_backoff: float = 30.) -> None:
+        self.__transport = TCPTransport(ip, port, b'\r', timeout)
+        self.max_backoff = max_backoff
+        self.__pressure = None
+        self.__new_frame = asyncio.Event()
+        self.__task = None
+        self.reconnects = 0
+
+    async def open(self) -> None:
+        await self.__transport.open()
+        await self.__transport.read_frame()  # the first frame may be incomplete
+        self.__task = asyncio.create_task(self.__read_loop())
+
+    async def close(self) -> None:
+        self.__task.cancel()
+        await self.__transport.close()
+
+    def __stale(self) -> None:  # do not serve the last value as if it were live
+        self.__pressure = None
+        self.__new_frame.clear()
+
+    async def __reconnect(self) -> None:
+        backoff = 1.
+        while True:
+            try:
+                await self.__transport.close()
+            except OSError:
+                pass
+            try:
+                await self.__transport.open()
+                await self.__transport.read_frame()
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError) as e:
+                logging.warning(f'DL7 {self.__transport.ip}, Reconnect Failed ({e!r}), retry in {backoff} s')
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+            self.reconnects += 1
+            logging.info(f'DL7 {self.__transport.ip}, Reconnected')
+            return
+
+    async def __read_loop(self) -> None:
+        while True:
+            try:
+                frame = await self.__transport.read_frame()
+            except asyncio.TimeoutError:  # stream stopped
+                self.__stale()
+                continue
+            except (OSError, asyncio.IncompleteReadError) as e:  # closed by the DL7 or the network
+                self.__stale()
+                logging.warning(f'DL7 {self.__transport.ip}, Connection Lost ({e!r})')
+                await self.__reconnect()
+                continue
+            self.__pressure = frame[:-3].decode().replace(' ', '')
+            self.__new_frame.set()
+
+    async def get_pressure(self) -> str:  # unit is Pa, raises asyncio.TimeoutError while stale
+        if self.__pressure is None:
+            await asyncio.wait_for(self.__new_frame.wait(), self.__transport.timeout)
+        return self.__pressure
+
+
+class AsyncXGS600(XGS600Protocol):
+    """
+    XGS600Protocol of lib/xgs600.py over the TCP serial server of the ion gauge (port 4001).
+    """
+
+    def __init__(self, ip: str = '192.168.30.129', port: int = 4001, gauges: list[str] = None,
+                 ion_gauge: str = 'HFIG1', timeout: float = 0.5) -> None:
+        super().__init__(gauges, ion_gauge)
+        self.__transport = TCPTransport(ip, port, b'\r', timeout)
+
+    async def open(self) -> None:
+        await self.__transport.open()
+
+    async def close(self) -> None:
+        await self.__transport.close()
+
+    async def query(self, cmd: str) -> str:
+        return (await self.query_many([cmd]))[0]
+
+    async def query_many(self, cmds: list[str]) -> list[str]:
+        return self.decode(await self.__transport.query_many(self.encode(cmds)))
+
+    async def request(self, request: tuple):
+        cmds, parse = request
+        return parse(await self.query_many(cmds))
+
+    async def read_emission_status(self) -> int:
+        return await self.request(self.emission_status_request())
+
+    async def read_filament(self) -> int:
+        return await self.request(self.filament_request())
+
+    async def read_pressure(self) -> str:
+        return await self.request(self.pressure_request())
+
+    async def read_all_pressures(self):
+        return await self.request(self.all_pressures_request())
+
+    async def read_all(self) -> dict:  # one batch
+        return await self.request(self.all_request())
+
+    async def set_emission_off(self) -> None:
+        await self.request(self.command_request('30'))
+
+    async def set_fil_1_emission_on(self) -> None:
+        await self.request(self.command_request('31'))
+
+    async def set_fil_2_emission_on(self) -> None:
+        await self.request(self.command_request('33'))
+
+
+async def main() -> None:
+    dl7, ion_gauge = AsyncDL7(), AsyncXGS600()
+    await asyncio.gather(dl7.open(), ion_gauge.open())
+    for _ in range(10):
+        print(await asyncio.gather(dl7.get_pressure(), ion_gauge.read_pressure(), return_exceptions=True))
+        await asyncio.sleep(1)
+    await asyncio.gather(dl7.close(), ion_gauge.close())
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,235 @@
+import os
+import sys
+import json
+import time
+import logging
+import platform
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from datetime import datetime
+
+from lib.daemon import timestamp_fmt
+from lib.data import ColumnStore, Writer, save, store_dtype
+from lib import devices, simulators, timing
+
+
+# python -m lib.benchmark [--duration 5] [--interval 0.05] [--storage save|writer|store] [--compare old.json]
+# Every device of lib/devices.py against its stand-in of lib/simulators.py, written through one storage
+# path. Each case runs free (back-to-back queries, the capacity) and paced at interval (the schedule of
+# Daemon), the result is saved as benchmarks/benchmark__{time}.json.
+
+
+PERCENTILES = [50, 90, 99]
+
+
+def percentiles(x: list) -> dict:  # in ms
+    if not x:
+        return {}
+    x = np.array(x) * 1e3
+    return {**{f'p{p}': float(np.percentile(x, p)) for p in PERCENTILES}, 'max': float(x.max())}
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def run(device, duration: float, interval: float = 0., storage: str = 'save') -> dict:
+    """
+    Queries an opened device for duration seconds, each row stored like the monitors do.
+    query is the device I/O with parsing, cycle adds the timestamp and storage, lateness is
+    the start of a cycle after its tick. cpu is the time of this thread, process_cpu includes
+    reader threads and the simulators. A streaming device (DL7) returns its latest frame, a row
+    is a sample only if a frame arrived since the last query, repeats counts the others.
+    """
+    query_times, cycle_times, lateness = [], [], []
+    samples, repeats, frames, errors = 0, 0, 0, 0
+    stream = getattr(device.inst, 'read_new', None)
+    if stream:
+        stream()
+    device.timer.clear()
+    with tempfile.TemporaryDirectory() as path:
+        if storage == 'writer':
+            writer = Writer(path, 'Benchmark', device.name, device.columns)
+        elif storage == 'store':
+            store = ColumnStore(path, 'Benchmark', device.name, device.columns, device.dtypes, segment_rows=1 << 16)
+        cpu, process_cpu, start = time.thread_time(), time.process_time(), time.perf_counter()
+        t_next = start
+        while (t0 := time.perf_counter()) - start < duration:
+            if interval:
+                lateness.append(t0 - t_next)
+            try:
+                row = device.query()
+            except Exception:
+                errors += 1
+                logging.exception(f'{device.name}, Query Failed')
+                row = None
+            t1 = time.perf_counter()
+            if row is not None and stream:
+                new_frames = len(stream())
+                frames += new_frames
+                if not new_frames:
+                    repeats += 1
+                    row = None
+            if row is not None:
+                t_now = datetime.now()
+                new_data = [t_now.strftime(timestamp_fmt), *row]
+                if storage == 'save':
+                    save(path, 'Benchmark', device.name, device.columns, new_data)
+                elif storage == 'writer':
+                    writer.append(new_data)
+                else:
+                    store.append(t_now, device.values(row))
+                samples += 1
+                query_times.append(t1 - t0)
+                cycle_times.append(time.perf_counter() - t0)
+            if interval:
+                t_next += interval
+                if t_next < time.perf_counter():  # overran, skip the missed ticks like Daemon
+                    t_next += ((time.perf_counter() - t_next) // interval + 1) * interval
+                time.sleep(max(0., t_next - time.perf_counter()))
+        elapsed = time.perf_counter() - start
+        cpu, process_cpu = time.thread_time() - cpu, time.process_time() - process_cpu
+        if storage == 'writer':
+            writer.close()
+        if storage == 'store':
+            store.close()
+            written = samples * store_dtype(device.columns, device.dtypes).itemsize
+        else:
+            written = dir_size(path)
+    return {
+        'interval': interval,
+        'samples': samples,
+        'errors': errors,
+        'samples_per_s': samples / elapsed,
+        'repeats': repeats,
+        'frames_per_s': (frames if stream else samples) / elapsed,
+        'query_ms': percentiles(query_times),
+        'cycle_ms': percentiles(cycle_times),
+        'lateness_ms': percentiles(lateness),
+        'cpu_ms_per_sample': cpu / max(samples, 1) * 1e3,
+        'process_cpu_ms_per_sample': process_cpu / max(samples, 1) * 1e3,
+        'bytes_per_sample': written / max(samples, 1),
+        'stages_ms': device.timer.summary(),  # inside query(), with timing enabled
+    }
+
+
+def cases(latency: float = None) -> dict:
+    # name -> () -> (device, simulator), created lazily so a failing one does not stop the others, the
+    # simulators bind free ports so a running monitor or a second benchmark does not collide
+    kwargs = {} if latency is None else {'latency': latency}
+
+    def dl7():
+        sim = simulators.DL7Simulator(rate=100, **kwargs)
+        return devices.DL7Device(ip='127.0.0.1', port=sim.serve_tcp(0)), sim
+
+    def ion_gauge_tcp():
+        sim = simulators.XGS600Simulator(**kwargs)
+        return devices.IonGaugeDevice(ip='127.0.0.1', port=sim.serve_tcp(0)), sim
+
+    def ion_gauge_serial():
+        sim = simulators.XGS600Simulator(**kwargs)
+        return devices.IonGaugeDevice(com=sim.serve_pty()), sim
+
+    def tc290():
+        sim = simulators.TC290Simulator(**kwargs)
+        return devices.TC290Device(com=sim.serve_pty(), interval=0.05), sim
+
+    def model336():
+        sim = simulators.Model336Simulator(**kwargs)
+        return devices.Model336Device(ip='127.0.0.1', port=sim.serve_tcp(0), interval=0.05), sim
+
+    def deepvna():
+        sim = simulators.DeepVNASimulator(drift=1e3, **kwargs)
+        return devices.DeepVNADevice(com=sim.serve_pty(), sampling_time=0.1), sim
+
+    def helium_stabilizer():
+        sim = simulators.helium_stabilizer_simulator(**kwargs)
+        return devices.HeliumStabilizerDevice(ip='127.0.0.1', port=sim.serve_tcp(0)), sim
+
+    return {'DL7': dl7, 'Ion Gauge TCP': ion_gauge_tcp, 'Ion Gauge Serial': ion_gauge_serial, 'TC290': tc290,
+            'Model336': model336, 'DeepVNA': deepvna, 'Helium Stabilizer': helium_stabilizer}
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return ''
+
+
+def benchmark(duration: float = 5., interval: float = 0.05, storage: str = 'save', latency: float = None,
+              names: list = None, stages: bool = False) -> dict:
+    timing.enable(stages)
+    result = {
+        'time': datetime.now().strftime(timestamp_fmt),
+        'commit': git_commit(),
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'duration': duration,
+        'storage': storage,
+        'latency': latency,
+        'stages': stages,
+        'cases': {},
+    }
+    for name, setup in cases(latency).items():
+        if names and name not in names:
+            continue
+        sim = None
+        try:
+            device, sim = setup()
+            device.open()
+        except Exception as e:  # python-snap7 or lakeshore missing, port in use, ...
+            logging.warning(f'{name}, skipped ({e!r})')
+            result['cases'][name] = {'skipped': repr(e)}
+            if sim:
+                sim.stop()
+            continue
+        try:
+            result['cases'][name] = {'free': run(device, duration, 0., storage),
+                                     'paced': run(device, duration, interval, storage)}
+        finally:
+            device.close()
+            sim.stop()
+        logging.info(f'{name}, {result["cases"][name]["free"]["samples_per_s"]:.1f} samples/s')
+    return result
+
+
+def compare(old: dict, new: dict) -> None:  # relative change of the main figures, + is slower for times
+    keys = [('free', 'samples_per_s', None), ('free', 'query_ms', 'p50'), ('free', 'query_ms', 'p99'),
+            ('paced', 'lateness_ms', 'p99'), ('free', 'cpu_ms_per_sample', None), ('free', 'bytes_per_sample', None)]
+    print(' ' * 20 + ''.join(f'{k + (" " + p if p else ""):>24}' for _, k, p in keys))
+    for name, case in new['cases'].items():
+        if 'skipped' in case or 'skipped' in old['cases'].get(name, {'skipped': ''}):
+            continue
+        changes = []
+        for run_name, k, p in keys:
+            a, b = old['cases'][name][run_name][k], case[run_name][k]
+            a, b = (a.get(p), b.get(p)) if p else (a, b)
+            changes.append(f'{(b / a - 1) * 100:+.1f}%' if a and b is not None else '-')
+        print(f'{name:20}' + ''.join(f'{x:>24}' for x in changes))
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--duration', type=float, default=5.)
+    parser.add_argument('--interval', type=float, default=0.05)
+    parser.add_argument('--storage', choices=['save', 'writer', 'store'], default='save')
+    parser.add_argument('--latency', type=float, default=None, help='reply latency of every simulator (s)')
+    parser.add_argument('--case', action='append', help='run only these cases')
+    parser.add_argument('--stages', action='store_true', help='time the stages inside query() (lib/timing.py)')
+    parser.add_argument('--compare', help='earlier result to compare with')
+    parser.add_argument('--out', default='benchmarks')
+    args = parser.parse_args()
+    result = benchmark(args.duration, args.interval, args.storage, args.latency, args.case, args.stages)
+    os.makedirs(args.out, exist_ok=True)
+    out_path = os.path.join(args.out, f'benchmark__{datetime.now().strftime("%Y%m%d_%H%M%S")}.json')
+    with open(out_path, 'w') as f:
+        json.dump(result, f, indent=2)
+    print(out_path)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
@@ -0,0 +1,109 @@
+import inspect
+import logging
+import threading
+from functools import partial
+
+
+# setter -> getters whose values it changes
+MODEL336_SETTERS = {
+    'set_heater_output_mode': ['get_heater_output_mode'],
+    'set_heater_pid': ['get_heater_pid'],
+    'set_heater_setup': ['get_heater_setup'],
+    'set_heater_range': ['get_heater_range'],
+    'all_heaters_off': ['get_heater_range'],
+}
+TC290_SETTERS = {
+    'configure_output_parameters': ['query_output_parameters'],
+    'configure_output_range': ['query_output_range'],
+    'configure_temperature_control_pid_parameters': ['query_temperature_control_pid_parameters'],
+    'configure_heating_output_parameters': ['query_heating_output_parameters'],
+}
+
+
+class ConfigCache:
+    """
+    Write-through shadow of the configuration of an instrument driver.
+    Getters of setters are served from the shadow after their first read, setters go to the
+    device and re-read the getters they change. A background thread re-reads every shadowed
+    value each verify_interval seconds, a value changed behind our back (front panel) is
+    logged as drift and taken over. Every other attribute is passed through to the driver,
+    all calls into the driver are serialized by one lock.
+    """
+
+    def __init__(self, inst, setters: dict[str, list[str]], verify_interval: float = 60) -> None:
+        self.inst = inst
+        self.setters = setters
+        self.getters = {getter for getters in setters.values() for getter in getters}
+        self.verify_interval = verify_interval
+        self.drifts = 0
+        self.__shadow = {}  # (getter, args, kwargs) -> value
+        self.__signatures = {}  # getter -> inspect.Signature
+        self.__lock = threading.RLock()
+        self.__stop = threading.Event()
+        self.__thread = threading.Thread(target=self.__verify_loop, daemon=True)
+        self.__thread.start()
+
+    def __getattr__(self, name: str):
+        attr = getattr(self.inst, name)
+        if name in self.getters:
+            return partial(self.__get, name)
+        if name in self.setters:
+            return partial(self.__set, name)
+        return partial(self.__call, attr) if callable(attr) else attr
+
+    def __call(self, method, *args, **kwargs):
+        with self.__lock:
+            return method(*args, **kwargs)
+
+    def __read(self, key: tuple):
+        name, args, kwargs = key
+        with self.__lock:
+            value = getattr(self.inst, name)(*args, **dict(kwargs))
+        self.__shadow[key] = value
+        return value
+
+    def __key(self, name: str, args: tuple, kwargs: dict) -> tuple:  # f(1) and f(output_channel=1) share one key
+        if name not in self.__signatures:
+            self.__signatures[name] = inspect.signature(getattr(self.inst, name))
+        bound = self.__signatures[name].bind(*args, **kwargs)
+        bound.apply_defaults()
+        return name, bound.args, tuple(sorted(bound.kwargs.items()))
+
+    def __get(self, name: str, *args, **kwargs):
+        key = self.__key(name, args, kwargs)
+        return self.__shadow[key] if key in self.__shadow else self.__read(key)
+
+    def __set(self, name: str, *args, **kwargs):
+        with self.__lock:
+            res = getattr(self.inst, name)(*args, **kwargs)
+            keys = [key for key in self.__shadow if key[0] in self.setters[name]]
+            for key in keys:  # re-read lazily if the read back fails
+                del self.__shadow[key]
+            for key in keys:
+                self.__read(key)
+        return res
+
+    def verify(self) -> list[tuple]:  # re-reads the shadow, returns the (getter, args, kwargs) that drifted
+        drifted = []
+        for key in list(self.__shadow):
+            with self.__lock:
+                if key not in self.__shadow:  # a failed read back, read on the next get
+                    continue
+                old = self.__shadow[key]
+                new = self.__read(key)
+            if new != old:
+                drifted.append(key)
+                self.drifts += 1
+                logging.warning(f'{type(self.inst).__name__}, {key[0]}{key[1]} drifted from {old} to {new}')
+        return drifted
+
+    def __verify_loop(self) -> None:
+        while not self.__stop.wait(self.verify_interval):
+            try:
+                self.verify()
+            except Exception:
+                logging.exception(f'{type(self.inst).__name__}, verify')
+
+    def stop(self) -> None:  # stops verifying, the driver is closed by its own close()/disconnect_tcp()
+        self.__stop.set()
+        self.__thread.join()
@@ -0,0 +1,196 @@
+import time
+import logging
+import threading
+from datetime import datetime
+import numpy as np
+import matplotlib.pyplot as plt
+
+from lib import timing
+from lib.data import ColumnStore, Writer, recompress
+from lib.live_plot import LivePlot
+from lib.metrics import Metrics
+from lib.ring_buffer import RingBuffer
+from lib.supervisor import Supervisor
+
+
+timestamp_fmt = '%Y-%m-%d %H:%M:%S.%f'
+
+
+class Device:
+    """
+    Plugin base for the acquisition daemon, see lib/devices.py.
+    Subclasses set name, columns (first is 'Time') and implement connect() and query(),
+    which returns one row without the time. settings maps a driver method to its argument(s)
+    and is applied once after connect, e.g. {'set_setpoint_a': 1.03, 'sweep': (41.96e6, 2e6, 301)}.
+    plot_columns / ylabels / styles / figsize describe the live plot window, no window if empty.
+    A query failing with one of connection_errors takes the device down until it reconnects.
+    """
+    name = ''
+    columns = ['Time']
+    dtypes = None
+    connection_errors = (OSError,)  # serial, socket and timeout errors
+    plot_columns = []
+    ylabels = []
+    styles = []
+    figsize = (12/2.54, 9/2.54)
+
+    def __init__(self, interval: float = 1, settings: dict = None) -> None:
+        self.interval = interval
+        self.settings = settings or {}
+        self.inst = None
+        self.timer = timing.timer(self.name)  # stages inside query(), next to those of Daemon
+
+    def connect(self):
+        raise NotImplementedError
+
+    def open(self) -> None:
+        self.inst = self.connect()
+        for method, args in self.settings.items():
+            getattr(self.inst, method)(*(args if isinstance(args, tuple) else (args,)))
+
+    def check(self) -> None:  # raises if the device does not answer after a reconnect
+        pass
+
+    def query(self) -> list:
+        raise NotImplementedError
+
+    def values(self, row: list) -> list:  # numeric values of a row for the cache and store
+        return row
+
+    def missing_values(self) -> list:  # recorded while the device is down, -1 for integer columns
+        dtypes = self.dtypes or {}
+        return [-1 if np.dtype(dtypes.get(c, '<f8')).kind in 'iu' else np.nan for c in self.columns[1:]]
+
+    def title(self, new_data: list) -> str:
+        return f'{new_data[0]}'
+
+    def close(self) -> None:
+        self.inst.close()
+
+
+class Daemon:
+    """
+    Runs several Device plugins in one process. Every device is polled by its own worker
+    thread at its own interval, so a slow device only delays itself. Storage (Writer,
+    ColumnStore, recompress) and the live plots are shared by all devices. Each device has a
+    Supervisor, while it is down its rows are recorded empty (NaN) without touching the link.
+    timing_interval > 0 times the stages of every cycle (lib/timing.py) and logs a summary every
+    timing_interval seconds. metrics_port serves the latest values with cycle time, failures and
+    reconnects of every device in the Prometheus text format (lib/metrics.py).
+    """
+
+    def __init__(self, devices: list[Device], task: str = 'Cryostat', path: str = '.', cache_num: int = 600,
+                 plot_interval: float = 5, save_store: bool = True, print_data: bool = False,
+                 timing_interval: float = 0, metrics_port: int = None) -> None:
+        self.__devices = devices
+        self.__task = task
+        self.__path = path
+        self.__cache_num = cache_num
+        self.__plot_interval = plot_interval
+        self.__save_store = save_store
+        self.__print_data = print_data
+        self.__timing_interval = timing_interval
+        self.__metrics_port = metrics_port
+        self.__stop = threading.Event()
+        self.__threads = []
+        self.__writers = {}
+        self.__stores = {}
+        self.supervisors = {}
+        self.caches = {}
+        self.last_data = {}
+        self.metrics = Metrics(task.lower())
+
+    def start(self) -> None:
+        if self.__timing_interval:
+            timing.enable()
+            timing.start_reporting(self.__timing_interval)
+        if self.__metrics_port:
+            self.metrics.serve(self.__metrics_port)
+        for device in self.__devices:
+            self.supervisors[device.name] = Supervisor(device)
+            self.supervisors[device.name].start()
+            self.__writers[device.name] = Writer(self.__path, self.__task, device.name, device.columns)
+            if self.__save_store:
+                self.__stores[device.name] = ColumnStore(
+                    self.__path, self.__task, device.name, device.columns, device.dtypes)
+            self.caches[device.name] = RingBuffer(self.__cache_num, device.columns[1:], device.dtypes)
+            thread = threading.Thread(target=self.__run, args=(device,), name=device.name, daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+            logging.info(f'{device.name}, Start')
+
+    def __run(self, device: Device) -> None:
+        supervisor = self.supervisors[device.name]
+        timer = timing.timer(device.name)
+        t_next = time.monotonic()
+        while not self.__stop.is_set():
+            t_now = datetime.now()
+            t0 = time.perf_counter()
+            try:
+                with timer.stage('cycle'):
+                    with timer.stage('query'):
+                        row = supervisor.query()
+                    if row is None:  # down
+                        new_data = [t_now.strftime(timestamp_fmt)] + [''] * (len(device.columns) - 1)
+                        values = device.missing_values()
+                    else:
+                        with timer.stage('format'):
+                            new_data = [t_now.strftime(timestamp_fmt), *row]
+                            values = device.values(row)
+                        if self.__print_data:
+                            print(device.name, new_data)
+                        self.last_data[device.name] = new_data
+                    with timer.stage('write'):
+                        self.__writers[device.name].append(new_data)
+                    self.caches[device.name].append(t_now.timestamp(), values)
+                    if self.__save_store:
+                        with timer.stage('store'):
+                            self.__stores[device.name].append(t_now, values)
+            except Exception:
+                logging.exception(f'{device.name}, Query Failed')
+            else:
+                if self.__metrics_port:
+                    self.metrics.update(device.name, device.columns[1:], values, t_now.timestamp(),
+                                        time.perf_counter() - t0)
+            if self.__metrics_port:
+                self.metrics.health(device.name, supervisor.up, supervisor.failures, supervisor.reconnects)
+            t_next += device.interval
+            if t_next < time.monotonic():  # overran, skip the missed ticks
+                t_next += ((time.monotonic() - t_next) // device.interval + 1) * device.interval
+            self.__stop.wait(t_next - time.monotonic())
+
+    def plot(self) -> None:  # blocks the main thread until every window is closed
+        plots = [(device, LivePlot(device.name, device.ylabels, device.styles, figsize=device.figsize))
+                 for device in self.__devices if device.plot_columns]
+        if not plots:
+            fig = plt.figure()
+            fig.canvas.manager.set_window_title(self.__task)
+            plt.axis('off')
+            plt.show()
+            return
+        while plots := [(device, live_plot) for device, live_plot in plots if live_plot.exists()]:
+            for device, live_plot in plots:
+                cache = self.caches[device.name]
+                if len(cache) > 0:
+                    x = cache.times() - cache.times()[-1]
+                    y = [cache[c] for c in device.plot_columns]
+                    last_data = self.last_data.get(device.name)
+                    title = (device.title(last_data) if self.supervisors[device.name].up and last_data
+                             else f'{device.name} disconnected, reconnecting')
+                    live_plot.update(x, y, title)
+            plots[0][1].pause(self.__plot_interval)
+
+    def stop(self) -> None:
+        self.__stop.set()
+        for thread in self.__threads:
+            thread.join()
+        for device in self.__devices:
+            self.supervisors[device.name].close()
+            self.__writers[device.name].close()
+            if self.__save_store:
+                self.__stores[device.name].close()
+            logging.info(f'{device.name}, Stop')
+            recompress(self.__path, self.__task, device.name, background='process')
+        if self.__timing_interval:
+            timing.stop_reporting()
+        self.metrics.close()
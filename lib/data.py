@@ -1,8 +1,27 @@
+import io
 import os
+import csv
+import sys
+import gzip
+import time
+import zlib
+import struct
+import logging
+import threading
+import subprocess
+import numpy as np
 import pandas as pd
 from datetime import datetime
 
 
+SEGMENT_ROWS = 1 << 20  # about 12 days at 1 Hz
+CHUNK_SIZE = 1 << 18  # compressed bytes read per step
+RANGE_CHUNK_SIZE = 1 << 14  # smaller steps for read_range, which stops early
+SYNC_MARKER = b'\x00\x00\xff\xff'  # end of a deflate sync flush
+INDEX_SPAN = 1 << 20  # uncompressed bytes between seek points
+INDEX_DTYPE = np.dtype([('time', '<i8'), ('offset', '<i8'), ('raw', '?')])  # time in us, raw is a full-flush point
+
+
 def save(path: str, task: str, name: str, columns: list, new_data: list) -> None:
     if not os.path.exists(path):
         os.makedirs(path)
@@ -17,9 +36,385 @@ def save(path: str, task: str, name: str, columns: list, new_data: list) -> None
                                     compression='gzip', mode='a', header=False, index=False)
 
 
-def recompress(path: str, task: str, name: str) -> None:
-    file_name = f'{task}__{datetime.now().year}__{name}.csv.gz'
+def inflate(f, offset: int = 0, chunk_size: int = CHUNK_SIZE):
+    # yields (member offset, data) over consecutive gzip members, (next member offset, b'') after each one ends
+    f.seek(offset)
+    d = zlib.decompressobj(wbits=31)
+    while chunk := f.read(chunk_size):
+        while chunk:
+            yield offset, d.decompress(chunk)
+            if not d.eof:
+                break
+            offset = f.tell() - len(d.unused_data)
+            chunk = d.unused_data
+            d = zlib.decompressobj(wbits=31)
+            yield offset, b''
+
+
+def inflate_from(f, offset: int, raw: bool, chunk_size: int = CHUNK_SIZE):
+    # like inflate, but may start at a full-flush point inside a member
+    if raw:
+        f.seek(offset)
+        d = zlib.decompressobj(wbits=-15)
+        while not d.eof and (chunk := f.read(chunk_size)):
+            yield d.decompress(chunk)
+        if not d.eof:
+            return
+        offset = f.tell() - len(d.unused_data) + 8  # skip the member trailer
+    for _, data in inflate(f, offset, chunk_size):
+        yield data
+
+
+def recompress(path: str, task: str, name: str, background: str = None, year: int = None):
+    """
+    Appends what was added to temp/{file} since the last call to {path}/{file}.
+    The checkpoint is the offset of the gzip member in the temp file plus the bytes of it already copied.
+    background: None|'thread'|'process', returns the started Thread or Popen
+    """
+    year = year or datetime.now().year
+    if background == 'thread':
+        thread = threading.Thread(target=recompress, args=(path, task, name, None, year))
+        thread.start()
+        return thread
+    if background == 'process':
+        return subprocess.Popen([sys.executable, '-m', 'lib.data', os.path.abspath(path), task, name, str(year)],
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    file_name = f'{task}__{year}__{name}.csv.gz'
     full_path_temp = os.path.join(path, 'temp', file_name)
     full_path = os.path.join(path, file_name)
-    pd.read_csv(full_path_temp, dtype=str).to_csv(
-        full_path, compression='gzip', header=True, index=False)
+    checkpoint_path = f'{full_path_temp}.ckpt'
+    member, skip = 0, 0
+    if os.path.exists(full_path) and os.path.exists(checkpoint_path):
+        with open(checkpoint_path) as f:
+            member, skip = map(int, f.read().split())
+        if member > os.path.getsize(full_path_temp):  # temp file was replaced
+            member, skip = 0, 0
+    with open(full_path_temp, 'rb') as src, gzip.open(full_path, 'ab' if member or skip else 'wb') as dst:
+        pos, tail = 0, b''  # pos counts decompressed bytes of the current member
+        for member_offset, data in inflate(src, member):
+            if member_offset != member:
+                member, skip, pos, tail = member_offset, 0, 0, b''
+            if pos + len(data) <= skip:
+                pos += len(data)
+                continue
+            data = tail + data[max(skip - pos, 0):]
+            pos = max(pos, skip) + len(data) - len(tail)
+            end = data.rfind(b'\n') + 1
+            dst.write(data[:end])
+            tail = data[end:]
+            skip = pos - len(tail)
+    with open(checkpoint_path, 'w') as f:
+        f.write(f'{member} {skip}')
+
+
+def gzip_header_size(data: bytes) -> int:
+    flags, size = data[3], 10
+    if flags & 4:  # FEXTRA
+        size += 2 + int.from_bytes(data[size:size + 2], 'little')
+    for flag in (8, 16):  # FNAME, FCOMMENT
+        if flags & flag:
+            size = data.index(b'\x00', size) + 1
+    return size + 2 if flags & 2 else size  # FHCRC
+
+
+def last_sync_point(member: bytes) -> (int, bytes):
+    # end of the last complete sync flush of an open gzip member and the data up to it, (0, b'') if none
+    try:
+        header = gzip_header_size(member)
+    except (IndexError, ValueError):  # torn inside the header
+        return 0, b''
+    limit = len(member)
+    while (i := member.rfind(SYNC_MARKER, header, limit)) >= 0:
+        end = i + len(SYNC_MARKER)
+        d = zlib.decompressobj(wbits=-15)
+        try:
+            data = d.decompress(member[header:end]) + d.decompress(b'\x03\x00')  # empty final block
+            if d.eof:  # a marker inside the deflate data does not end a block
+                return end, data
+        except zlib.error:
+            pass
+        limit = end - 1
+    return 0, b''
+
+
+def repair(full_path: str) -> None:
+    """
+    Closes the gzip member left open by a Writer that did not close, so new members can follow
+    it. A torn last flush (power cut mid-write) is cut off first: the file is truncated at the
+    last complete sync flush, or at the start of the member if it has none, and the seek index
+    and recompress checkpoint are cut back to that point.
+    """
+    size = os.path.getsize(full_path)
+    member, end, data = 0, 0, b''  # start of the last member, its sync point and data
+    with open(full_path, 'rb') as f:
+        f.seek(max(0, size - 10))
+        if f.read()[:2] == b'\x03\x00':  # ends with the final block and trailer of Writer.close
+            return
+        closed = size == 0
+        try:
+            for member_offset, data in inflate(f):
+                if member_offset != member:
+                    member = member_offset
+                closed = not data
+        except zlib.error:
+            closed = False
+        if closed and member == size and size:
+            return
+        f.seek(member)
+        end, data = last_sync_point(f.read())
+    cut = member + end
+    with open(full_path, 'r+b') as f:
+        f.truncate(cut)
+        if end:
+            f.seek(cut)
+            f.write(b'\x03\x00' + struct.pack('<II', zlib.crc32(data), len(data) & 0xffffffff))
+    if os.path.exists(f'{full_path}.idx'):
+        index = np.fromfile(f'{full_path}.idx', INDEX_DTYPE)
+        index[index['offset'] < cut].tofile(f'{full_path}.idx')
+    if os.path.exists(f'{full_path}.ckpt'):
+        with open(f'{full_path}.ckpt') as f:
+            ckpt_member, skip = map(int, f.read().split())
+        if ckpt_member >= member:
+            with open(f'{full_path}.ckpt', 'w') as f:
+                f.write(f'{member} {min(skip, len(data))}' if end else f'{cut} 0')
+    if size:
+        logging.warning(f'{full_path}, repaired, cut {size - cut} bytes after the last complete flush')
+
+
+class Writer:
+    """
+    Long-lived replacement of save for one (task, name) file. Rows go through one open gzip
+    member and are sync-flushed every flush_rows rows or flush_interval seconds, so the file
+    stays readable up to the last flush if the process dies.
+    About every index_span bytes the flush is a full flush instead, and the time of the next
+    row and the file offset are appended to {file}.idx as a seek point for read_range.
+    """
+
+    def __init__(self, path: str, task: str, name: str, columns: list,
+                 flush_rows: int = 60, flush_interval: float = 10., index_span: int = INDEX_SPAN) -> None:
+        self.__path = path
+        self.__task = task
+        self.__name = name
+        self.__columns = columns
+        self.__flush_rows = flush_rows
+        self.__flush_interval = flush_interval
+        self.__index_span = index_span
+        self.__buffer = io.StringIO()
+        self.__csv = csv.writer(self.__buffer, lineterminator='\n')
+        self.__file = None
+        self.__open()
+
+    def __open(self) -> None:
+        self.__year = datetime.now().year
+        if not os.path.exists(os.path.join(self.__path, 'temp')):
+            os.makedirs(os.path.join(self.__path, 'temp'))
+        full_path_temp = os.path.join(self.__path, 'temp', f'{self.__task}__{self.__year}__{self.__name}.csv.gz')
+        if os.path.exists(full_path_temp):
+            repair(full_path_temp)  # may cut the file back to nothing
+        new_file = not os.path.exists(full_path_temp) or os.path.getsize(full_path_temp) == 0
+        if not new_file:  # rows of other columns would be read under the old header
+            with open(full_path_temp, 'rb') as f:
+                header = next(csv.reader([read_header(f).decode()]))
+            if header != list(self.__columns):
+                raise ValueError(f'{full_path_temp} was written with columns {header}')
+        self.__index_path = f'{full_path_temp}.idx'
+        self.__block = (os.path.getsize(full_path_temp) if not new_file else 0, False)
+        self.__span = 0
+        self.__entries = []
+        self.__file = open(full_path_temp, 'ab')
+        self.__compressor = zlib.compressobj(wbits=31)
+        self.__rows = 0
+        self.__last_flush = time.monotonic()
+        if new_file:
+            self.__csv.writerow(self.__columns)
+            checkpoint_path = f'{full_path_temp}.ckpt'
+            if os.path.exists(checkpoint_path):  # cut back to nothing by repair, the archive has the header
+                with open(checkpoint_path) as f:
+                    if f.read().split() == ['0', '0']:
+                        with open(checkpoint_path, 'w') as f_ckpt:
+                            f_ckpt.write(f'0 {len(self.__buffer.getvalue().encode())}')
+
+    def append(self, new_data: list) -> None:
+        if datetime.now().year != self.__year:
+            self.close()
+            self.__open()
+        if self.__block:
+            self.__entries.append((np.datetime64(new_data[0], 'us').astype(np.int64), *self.__block))
+            self.__block = None
+        self.__csv.writerow(new_data)
+        self.__rows += 1
+        if self.__rows >= self.__flush_rows or time.monotonic() - self.__last_flush >= self.__flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        data = self.__buffer.getvalue().encode()
+        self.__buffer.seek(0)
+        self.__buffer.truncate()
+        self.__span += len(data)
+        full = self.__span >= self.__index_span
+        self.__file.write(self.__compressor.compress(data) +
+                          self.__compressor.flush(zlib.Z_FULL_FLUSH if full else zlib.Z_SYNC_FLUSH))
+        self.__file.flush()
+        if full:
+            self.__block = (self.__file.tell(), True)
+            self.__span = 0
+        if self.__entries:
+            with open(self.__index_path, 'ab') as f:
+                np.array(self.__entries, INDEX_DTYPE).tofile(f)
+            self.__entries = []
+        self.__rows = 0
+        self.__last_flush = time.monotonic()
+
+    def close(self) -> None:
+        if self.__file is None:
+            return
+        self.flush()
+        self.__file.write(self.__compressor.flush())
+        self.__file.close()
+        self.__file = None
+
+
+def read_header(f) -> bytes:
+    head = b''
+    for _, data in inflate(f, 0, RANGE_CHUNK_SIZE):
+        head += data
+        if b'\n' in head:
+            break
+    return head.split(b'\n')[0]
+
+
+def read_range_lines(full_path: str, t1: np.datetime64, t2: np.datetime64) -> (bytes, list[bytes]):
+    offset, raw = 0, False
+    if os.path.exists(f'{full_path}.idx'):
+        index = np.fromfile(f'{full_path}.idx', INDEX_DTYPE)
+        i = np.searchsorted(index['time'], t1.astype(np.int64)) - 1
+        if i >= 0:
+            offset, raw = int(index['offset'][i]), bool(index['raw'][i])
+    lines, tail = [], b''
+    with open(full_path, 'rb') as f:
+        header = read_header(f)
+        for data in inflate_from(f, offset, raw, RANGE_CHUNK_SIZE):
+            data = tail + data
+            end = data.rfind(b'\n') + 1
+            tail = data[end:]
+            block = [x for x in data[:end].split(b'\n')[:-1] if x != header]
+            if not block:
+                continue
+            times = np.array([x[:x.find(b',')].decode() for x in block], 'datetime64[us]')
+            lines += [x for x, keep in zip(block, (times >= t1) & (times <= t2)) if keep]
+            if times[-1] > t2:
+                break
+    return header, lines
+
+
+def read_range(path: str, task: str, name: str, t1: str, t2: str, columns: list = None) -> pd.DataFrame:
+    """
+    Rows with t1 <= Time <= t2 from the temp/*.csv.gz files of the years in range, e.g.
+    read_range('.', 'Cryostat', 'DL7', '2025-05-22 09', '2025-05-22 14', ['Pressure(Pa)']).
+    Decompression starts at the last seek point before t1 written by Writer and stops after t2,
+    files written by save have no index and are scanned from the start. Without rows the frame
+    is empty but keeps the columns of the file.
+    """
+    t1, t2 = np.datetime64(t1, 'us'), np.datetime64(t2, 'us')
+    header, lines = None, []
+    for year in range(t1.astype(datetime).year, t2.astype(datetime).year + 1):
+        full_path_temp = os.path.join(path, 'temp', f'{task}__{year}__{name}.csv.gz')
+        if os.path.exists(full_path_temp):
+            header, new_lines = read_range_lines(full_path_temp, t1, t2)
+            lines += new_lines
+    if header is None:  # no file in range, the header of another year, Time at least
+        temp_dir = os.path.join(path, 'temp')
+        suffix = f'__{name}.csv.gz'
+        others = sorted(x for x in os.listdir(temp_dir) if x.startswith(f'{task}__') and x.endswith(suffix)
+                        and x[len(task) + 2:-len(suffix)].isdigit()) if os.path.exists(temp_dir) else []
+        if not others:
+            return pd.DataFrame(columns=['Time'] + (columns or []))
+        with open(os.path.join(temp_dir, others[-1]), 'rb') as f:
+            header = read_header(f)
+    df = pd.read_csv(io.BytesIO(b'\n'.join([header] + lines)))
+    return df[[df.columns[0]] + columns] if columns else df
+
+
+def store_dtype(columns: list, dtypes: dict = None) -> np.dtype:
+    # first column is the timestamp in epoch ns, the others default to float64
+    dtypes = dtypes or {}
+    return np.dtype([(columns[0], '<i8')] + [(c, dtypes.get(c, '<f8')) for c in columns[1:]])
+
+
+def store_dir(path: str, task: str, name: str) -> str:
+    return os.path.join(path, 'store', f'{task}__{name}')
+
+
+def valid_rows(segment: np.ndarray) -> int:  # written rows are a prefix with non-zero time
+    time = segment[segment.dtype.names[0]]
+    lo, hi = 0, len(segment)
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if time[mid]:
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def load_store(path: str, task: str, name: str) -> list[np.ndarray]:
+    # zero-copy views of every segment, np.concatenate them if one array is needed
+    seg_dir = store_dir(path, task, name)
+    if not os.path.exists(seg_dir):
+        return []
+    segments = []
+    for seg_name in sorted(os.listdir(seg_dir)):
+        if seg_name.endswith('.npy'):
+            segment = np.load(os.path.join(seg_dir, seg_name), mmap_mode='r')
+            segments.append(segment[:valid_rows(segment)])
+    return segments
+
+
+class ColumnStore:
+    """
+    Appends typed rows into preallocated, memory-mapped .npy segments under
+    {path}/store/{task}__{name}/, read back with load_store.
+    """
+
+    def __init__(self, path: str, task: str, name: str, columns: list, dtypes: dict = None,
+                 segment_rows: int = SEGMENT_ROWS) -> None:
+        self.__dir = store_dir(path, task, name)
+        self.__dtype = store_dtype(columns, dtypes)
+        self.__segment_rows = segment_rows
+        if not os.path.exists(self.__dir):
+            os.makedirs(self.__dir)
+        seg_names = sorted(x for x in os.listdir(self.__dir) if x.endswith('.npy'))
+        if seg_names:
+            self.__index = int(seg_names[-1][:-4])
+            self.__segment = np.load(os.path.join(self.__dir, seg_names[-1]), mmap_mode='r+')
+            if self.__segment.dtype != self.__dtype:
+                raise ValueError(f'{self.__dir} was written with columns {self.__segment.dtype.names}')
+            self.__row = valid_rows(self.__segment)
+        else:
+            self.__index = -1
+            self.__new_segment()
+
+    def __new_segment(self) -> None:
+        self.__index += 1
+        self.__segment = np.lib.format.open_memmap(
+            os.path.join(self.__dir, f'{self.__index:06d}.npy'), mode='w+',
+            dtype=self.__dtype, shape=(self.__segment_rows,))
+        self.__row = 0
+
+    def append(self, t: datetime, new_data: list) -> None:
+        if self.__row == len(self.__segment):
+            self.__segment.flush()
+            self.__new_segment()
+        self.__segment[self.__row] = (round(t.timestamp() * 1e6) * 1000, *new_data)
+        self.__row += 1
+
+    def flush(self) -> None:
+        self.__segment.flush()
+
+    def close(self) -> None:
+        self.__segment.flush()
+        del self.__segment
+
+
+if __name__ == '__main__':
+    recompress(sys.argv[1], sys.argv[2], sys.argv[3], year=int(sys.argv[4]))
@@ -1,5 +1,7 @@
 import time
+import logging
 import serial
+from collections import defaultdict, deque
 import serial.tools.list_ports
 import numpy as np
 from matplotlib import pyplot as plt
@@ -11,10 +13,14 @@ def find_com_name(serial_number:str) -> str:
     if names:
         return names[0]
     else:
-        raise
+        raise serial.SerialException(f'no serial port with serial number {serial_number}')
 
 
-def notch_search(frq: list[float], s11: list[float]) -> (float, float, float, float, float, float):
+SCAN_BINARY_MASK = 0x83  # binary | frequency | data 0
+SCAN_BINARY_DTYPE = np.dtype([('frequency', '<u4'), ('data0', '<f4', 2)])  # one point of 'scan ... 0x83'
+
+
+def notch_search(frq: np.ndarray, s11: np.ndarray) -> (float, float, float, float, float, float):
     max, argmax = np.max(s11), np.argmax(s11)
     min, argmin = np.min(s11), np.argmin(s11)
     l_argmin = np.argmin(np.abs(s11[: argmin] - (max - 3)))
@@ -28,9 +34,93 @@ def notch_search(frq: list[float], s11: list[float]) -> (float, float, float, fl
     return center, s11_center, center_left_3db, s11_left_3db, center_right_3db, s11_right_3db, frq_s11_max, s11_max
 
 
+def fit_notch(frq: np.ndarray, s11: np.ndarray, n_iter: int = 30) -> dict[str, np.ndarray]:
+    """
+    Least-squares fit of a Lorentzian dip p = c - d / (1 + ((f - f0) / hw)**2) to the power
+    10**(s11 / 10) of one (n,) or many (m, n) traces at once, Levenberg-Marquardt vectorized over
+    the traces and started at the notch_search point. frq is (n,) or (m, n), s11 in dB.
+    Returns (m,) arrays of center, linewidth (2 hw), quality (center / linewidth), depth (dB below
+    the baseline), baseline (dB), left_3db and right_3db (3 dB below the baseline, nan for a
+    shallower notch) and the standard errors center_err, linewidth_err, quality_err, depth_err.
+    """
+    s11 = np.atleast_2d(s11)
+    frq = np.broadcast_to(frq, s11.shape)
+    m, n = s11.shape
+    df = frq[:, 1] - frq[:, 0]
+    # start, argmin and max as notch_search, half width from the points below half depth
+    argmin = np.argmin(s11, 1)
+    f0 = frq[np.arange(m), argmin]
+    scale = 10 ** (s11.max(1) / 10)
+    p = 10 ** (s11 / 10) / scale[:, None]
+    u = (frq - f0[:, None]) / df[:, None]  # frequency in steps from the start
+    d0 = 1 - p.min(1)
+    w0 = np.maximum((p < (1 - d0 / 2)[:, None]).sum(1) / 2, 0.5)
+    theta = np.stack([np.zeros(m), w0, np.ones(m), d0], 1)  # u0, w, c, d
+
+    def residual_jacobian(theta):
+        u0, w, c, d = theta.T[:, :, None]
+        z = (u - u0) / w
+        lorentz = 1 / (1 + z ** 2)
+        r = p - (c - d * lorentz)
+        jac = np.stack([-2 * d * z * lorentz ** 2 / w, -2 * d * z ** 2 * lorentz ** 2 / w,
+                        np.ones_like(z), -lorentz], 2)
+        return r, jac
+
+    r, jac = residual_jacobian(theta)
+    cost = (r ** 2).sum(1)
+    lam = np.full(m, 1e-3)
+    for _ in range(n_iter):
+        a = np.einsum('mni,mnj->mij', jac, jac)
+        g = np.einsum('mni,mn->mi', jac, r)
+        damped = a + lam[:, None, None] * a * np.eye(4)
+        step = np.linalg.solve(damped, g[:, :, None])[:, :, 0]
+        new_theta = theta + step
+        new_theta[:, 1] = np.abs(new_theta[:, 1])
+        new_r, new_jac = residual_jacobian(new_theta)
+        new_cost = (new_r ** 2).sum(1)
+        better = new_cost < cost
+        theta[better], r[better], jac[better], cost[better] = new_theta[better], new_r[better], new_jac[better], new_cost[better]
+        lam = np.where(better, lam / 10, lam * 10)
+
+    a = np.einsum('mni,mnj->mij', jac, jac)
+    cov = np.linalg.pinv(a) * (cost / (n - 4))[:, None, None]
+    u0, w, c, d = theta.T
+    center, hw = f0 + u0 * df, w * df
+    quality = center / (2 * hw)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        depth = 10 * np.log10(c / (c - d))
+        x3 = np.sqrt(d / (c * (1 - 10 ** -0.3)) - 1)  # -3 dB from the baseline, in hw
+        grad_quality = np.stack([df / (2 * hw), -quality / w, np.zeros(m), np.zeros(m)], 1)
+        grad_depth = 10 / np.log(10) * np.stack([np.zeros(m), np.zeros(m), 1 / c - 1 / (c - d), 1 / (c - d)], 1)
+    return {
+        'center': center, 'linewidth': 2 * hw, 'quality': quality, 'depth': depth,
+        'baseline': 10 * np.log10(c * scale),
+        'left_3db': center - hw * x3, 'right_3db': center + hw * x3,
+        'center_err': np.sqrt(cov[:, 0, 0]) * df, 'linewidth_err': 2 * np.sqrt(cov[:, 1, 1]) * df,
+        'quality_err': np.sqrt(np.einsum('mi,mij,mj->m', grad_quality, cov, grad_quality)),
+        'depth_err': np.sqrt(np.einsum('mi,mij,mj->m', grad_depth, cov, grad_depth)),
+    }
+
+
+def notch_fit(frq: np.ndarray, s11: np.ndarray, fit: dict = None) -> (float, float, float, float, float, float, float, float):
+    # notch_search with center and -3 dB points from fit_notch between the samples, sampled values if the fit fails
+    notch = notch_search(frq, s11)
+    fit = fit or {k: v[0] for k, v in fit_notch(frq, s11).items()}
+    if not np.isfinite([fit['left_3db'], fit['right_3db']]).all():
+        return notch
+    s11_center = fit['baseline'] - fit['depth']
+    return fit['center'], s11_center, fit['left_3db'], fit['baseline'] - 3, fit['right_3db'], fit['baseline'] - 3, *notch[6:]
+
+
+def duration_stats(x) -> dict:  # n, mean, p50, p99 and max (ms) of durations in s
+    p50, p99 = np.percentile(x, [50, 99]) * 1e3
+    return {'n': len(x), 'mean': float(np.mean(x)) * 1e3, 'p50': float(p50), 'p99': float(p99),
+            'max': float(np.max(x)) * 1e3}
+
+
 class DeepVNA:
     
-    def __init__(self,  serial_number:str = None, com:str = None, baudrate = 115200) -> None:
+    def __init__(self,  serial_number:str = None, com:str = None, baudrate = 115200, binary:bool = True) -> None:
         if serial_number:
             port = find_com_name(serial_number)
         elif com:
@@ -38,23 +128,67 @@ class DeepVNA:
         else:
             raise
         self.__ser = serial.Serial(port=port, baudrate=baudrate)
-        self.__ser.timeout = 0
+        self.__ser.timeout = 0.1  # one blocking read, the deadline of a query is checked between reads
+        self.__frequencies = None  # grid of the current sweep, read once after sweep()
+        self.__sweep = None  # (start, stop, points)
+        self.binary = binary  # binary scan, falls back to ascii on firmware without it
+        self.__rx = bytearray()  # received but not yet consumed
+        self.latency = defaultdict(lambda: deque(maxlen=1000))  # command -> last latencies (s)
+        self.timeouts = 0
+        self.single_shot = True  # 'scan' returns when the sweep is done, firmware without it sweeps for sampling_time
+        self.sweep_timeout = 30.
+        self.sweep_durations = deque(maxlen=1000)  # s, from the sweep command to its data
         self.init_dev()
     
     def close(self) -> None:
         self.__ser.close()
         
-    def query(self, cmd: str) -> str:
-        t0 = time.time()
+    def __fill(self, deadline:float) -> None:  # returns as soon as any byte arrived
+        recv = self.__ser.read(self.__ser.in_waiting or 1)
+        if recv:
+            self.__rx += recv
+        elif time.perf_counter() > deadline:  # no echo of the command is a timeout too
+            received = bytes(self.__rx[-64:])
+            self.__rx.clear()  # a late response would be taken for the next one
+            self.__ser.reset_input_buffer()
+            self.timeouts += 1
+            raise TimeoutError(f'DeepVNA, no response, received {received}')
+    
+    def __read(self, size:int, timeout:float = 5.) -> bytes:
+        deadline = time.perf_counter() + timeout
+        while len(self.__rx) < size:
+            self.__fill(deadline)
+        recv = bytes(self.__rx[:size])
+        del self.__rx[:size]
+        return recv
+    
+    def __read_until(self, terminator:bytes, timeout:float = 5.) -> bytes:
+        deadline = time.perf_counter() + timeout
+        start = 0
+        while (i := self.__rx.find(terminator, start)) < 0:
+            start = max(0, len(self.__rx) - len(terminator) + 1)
+            self.__fill(deadline)
+        return self.__read(i + len(terminator))
+    
+    def __command(self, cmd: str, timeout: float = 5.) -> None:
+        # sends cmd and reads up to its echo, output of a timed out command before it is dropped
+        self.__rx.clear()
+        self.__ser.reset_input_buffer()
         self.__ser.write(f'{cmd}\r'.encode())
-        time.sleep(0.001)
-        recv = self.__ser.read(1024).decode('utf-8')
-        while not recv.endswith('ch> '):
-            time.sleep(0.01)
-            recv += self.__ser.read(1024).decode('utf-8')
-        res = recv.replace(f'{cmd}\r\n', '').replace('ch> ', '')
-        print('query cost: ', time.time() - t0)
-        return res
+        self.__read_until(f'{cmd}\r\n'.encode(), timeout)
+
+    def query(self, cmd: str, timeout: float = 5.) -> str:
+        t0 = time.perf_counter()
+        self.__command(cmd, timeout)
+        recv = self.__read_until(b'ch> ', timeout - (time.perf_counter() - t0)).decode('utf-8')
+        self.latency[cmd.split(' ')[0]].append(time.perf_counter() - t0)
+        return recv[:-len('ch> ')]
+    
+    def latency_stats(self) -> dict[str, dict]:  # command -> n, mean, p50, p99 and max latency (ms)
+        return {cmd: duration_stats(x) for cmd, x in self.latency.items() if x}
+    
+    def sweep_stats(self) -> dict:  # n, mean, p50, p99 and max duration (ms) of complete sweeps
+        return duration_stats(self.sweep_durations) if self.sweep_durations else {}
     
     def init_dev(self) -> None:
         self.query('trace 0 logmag 0')
@@ -66,20 +200,109 @@ class DeepVNA:
         start = center - span / 2
         stop = center + span / 2
         self.query(f'sweep {start} {stop} {points}')
+        self.__frequencies = None
+        self.__sweep = (start, stop, points)
     
-    def sweep_once(self, sampling_time: float = 2) -> None:
+    def sweep_once(self, sampling_time: float = 2) -> None:  # one complete sweep of the current range, read by data0()
+        t0 = time.perf_counter()
+        if self.single_shot and self.__sweep:
+            start, stop, points = self.__sweep
+            res = self.query(f'scan {start:.0f} {stop:.0f} {points}', self.sweep_timeout)
+            if not res.strip():
+                self.sweep_durations.append(time.perf_counter() - t0)
+                return
+            logging.warning(f'DeepVNA, no single-shot scan ({res.strip()}), sweeping for sampling_time')
+            self.single_shot = False
         self.query('resume')
         time.sleep(sampling_time)
         self.query('pause')
+        self.sweep_durations.append(time.perf_counter() - t0)
     
-    def frequencies(self) -> list[float]:
-        res = self.query('frequencies')
-        return [float(x) for x in res.split('\r\n')[:-1]]
+    def frequencies(self) -> np.ndarray:
+        if self.__frequencies is None:
+            self.__frequencies = np.fromstring(self.query('frequencies'), sep=' ')
+        return self.__frequencies
     
-    def data0(self) -> list[list[float, float]]:
-        res = self.query('data 0')
-        return [[float(y) for y in x.split(' ')] for x in res.split('\r\n')[:-1]]
-        
+    def data0(self) -> np.ndarray:  # complex128, 're im' per line
+        return np.fromstring(self.query('data 0'), sep=' ').view(np.complex128)
+    
+    def s11_db(self, data:np.ndarray = None) -> np.ndarray:
+        return 20 * np.log10(np.abs(self.data0() if data is None else data))
+    
+    def scan_binary(self) -> (np.ndarray, np.ndarray):
+        # one sweep of the current range as uint16 mask, uint16 points, then uint32 frequency, float32 re, im per point
+        t0 = time.perf_counter()
+        start, stop, points = self.__sweep
+        self.__command(f'scan {start:.0f} {stop:.0f} {points} {SCAN_BINARY_MASK}')
+        mask, n = np.frombuffer(self.__read(4, self.sweep_timeout), '<u2')  # sent after the sweep
+        if mask != SCAN_BINARY_MASK or n != points:
+            self.__read_until(b'ch> ')
+            raise ValueError(f'no binary scan, header {mask:#x} {n}')
+        trace = np.frombuffer(self.__read(n * SCAN_BINARY_DTYPE.itemsize), SCAN_BINARY_DTYPE)
+        self.__read_until(b'ch> ')
+        self.latency['scan'].append(time.perf_counter() - t0)
+        self.sweep_durations.append(time.perf_counter() - t0)
+        return trace['frequency'].astype(np.float64), trace['data0'].astype(np.float64).view(np.complex128)[:, 0]
+    
+    def acquire(self, sampling_time:float = 2) -> (np.ndarray, np.ndarray):  # frequencies and data 0 of the current sweep
+        if self.binary and self.__sweep:
+            try:
+                return self.scan_binary()
+            except ValueError:
+                logging.warning('DeepVNA, binary scan unsupported, falling back to ascii')
+                self.binary = False
+        self.sweep_once(sampling_time)
+        return self.frequencies(), self.data0()
+
+
+class ResonanceTracker:
+    """
+    Keeps the sweep of a DeepVNA on the notch. After each trace, update() fits the notch and
+    re-centers the sweep on it with a span of `linewidths` linewidths (at least min_span), so the
+    points land on the resonance while it drifts. Small moves within a tenth of the span do not
+    re-sweep. When the notch is lost (fit failed, shallower than min_depth dB, relative Q error
+    above max_quality_err, or center outside the swept range) it falls back to the wide
+    (center, span) search sweep.
+    """
+
+    def __init__(self, inst: DeepVNA, center: float, span: float, points: int = 301, linewidths: float = 8,
+                 min_span: float = None, min_depth: float = 3, max_quality_err: float = 0.1) -> None:
+        self.inst = inst
+        self.wide = (center, span)
+        self.points = points
+        self.linewidths = linewidths
+        self.min_span = min_span or span / 50
+        self.min_depth = min_depth
+        self.max_quality_err = max_quality_err
+        self.tracking = False
+        self.sweeps = 0  # sweep commands sent
+        self.losses = 0  # falls back to the wide sweep
+        self.__sweep(center, span)
+
+    def __sweep(self, center: float, span: float) -> None:
+        self.center, self.span = center, span
+        self.inst.sweep(center, span, self.points)
+        self.sweeps += 1
+
+    def update(self, frq: np.ndarray, s11: np.ndarray) -> (float, float, float, float, float, float, float, float):
+        fit = {k: v[0] for k, v in fit_notch(frq, s11).items()}
+        found = (np.isfinite([fit['center'], fit['left_3db'], fit['right_3db'], fit['quality_err']]).all()
+                 and fit['depth'] >= self.min_depth
+                 and fit['quality_err'] <= self.max_quality_err * fit['quality']
+                 and frq[0] < fit['center'] < frq[-1])
+        if found:
+            span = min(max(self.linewidths * fit['linewidth'], self.min_span), self.wide[1])
+            if (not self.tracking or abs(fit['center'] - self.center) > self.span / 10
+                    or not 0.8 < span / self.span < 1.25):
+                self.__sweep(fit['center'], span)
+            self.tracking = True
+        elif self.tracking or self.span != self.wide[1]:
+            logging.warning(f'DeepVNA, notch lost at {self.center} Hz, searching {self.wide[1]} Hz')
+            self.losses += 1
+            self.tracking = False
+            self.__sweep(*self.wide)
+        return notch_fit(frq, s11, fit)
+
 
 if __name__ == '__main__':
     deepvna = DeepVNA(serial_number='6561E2CB0E32')
@@ -88,8 +311,9 @@ if __name__ == '__main__':
     print(time.time() - t0)
     frq = deepvna.frequencies()
     print(time.time() - t0)
-    s11 = [20 * np.log10(np.linalg.norm(x)) for x in deepvna.data0()]
+    s11 = deepvna.s11_db()
     print(time.time() - t0)
+    print(deepvna.latency_stats(), deepvna.sweep_stats())
     deepvna.close()
     
     center, s11_center, center_left_3db, s11_left_3db, center_right_3db, s11_right_3db, frq_s11_max, s11_max = notch_search(frq, s11)
@@ -97,7 +321,7 @@ if __name__ == '__main__':
     quality = center / (center_right_3db - center_left_3db)
     print(center, reflect, quality)
     
-    plt.plot([x * 1e-6 for x in frq], s11)
+    plt.plot(frq * 1e-6, s11)
     plt.plot(center * 1e-6, s11_center, 'o')
     plt.plot(center_left_3db * 1e-6, s11_left_3db, 'o')
     plt.plot(center_right_3db * 1e-6, s11_right_3db, 'o')
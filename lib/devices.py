@@ -0,0 +1,306 @@
+import logging
+import numpy as np
+from functools import partial
+
+from lib.daemon import Device
+from lib.polling import MultiRatePoller
+
+
+# drivers are imported in connect(), so a missing snap7 or lakeshore only matters to the devices using them
+
+
+class DL7Device(Device):
+    name = 'DL7'
+    columns = ['Time', 'Pressure(Pa)']
+    plot_columns = ['Pressure(Pa)']
+    ylabels = ['Pressure(Pa)']
+    styles = ['.-']
+
+    def __init__(self, ip: str = '192.168.30.131', port: int = 8234, interval: float = 1,
+                 settings: dict = None) -> None:
+        super().__init__(interval, settings)
+        self.ip = ip
+        self.port = port
+
+    def connect(self):
+        from lib.dl7 import DL7
+        return DL7(self.ip, self.port)
+
+    def check(self) -> None:  # the socket connects even when no frames arrive
+        self.inst.get_pressure()
+
+    def query(self) -> list:
+        return [self.inst.get_pressure()]
+
+
+class IonGaugeDevice(Device):
+    name = 'Ion Gauge'
+    dtypes = {'Emission': '<i4', 'Filament': '<i4'}
+    styles = ['.-']
+
+    def __init__(self, serial_number: str = None, com: str = None, ip: str = None, port: int = 4001,
+                 gauges: list[str] = ('HFIG1',), interval: float = 1, settings: dict = None) -> None:
+        super().__init__(interval, settings)
+        self.serial_number = serial_number
+        self.com = com
+        self.ip = ip  # TCP serial server of the controller instead of a local port
+        self.port = port
+        self.gauges = list(gauges)  # user labels of the controller's gauges in read-all order, the ion gauge first
+        self.columns = ['Time'] + [f'{x}(Pa)' for x in self.gauges] + ['Emission', 'Filament']
+        self.plot_columns = self.ylabels = [f'{self.gauges[0]}(Pa)']
+
+    def connect(self):
+        from lib.xgs600 import XGS600
+        return XGS600(serial_number=self.serial_number, com=self.com, ip=self.ip, port=self.port,
+                      gauges=self.gauges, ion_gauge=self.gauges[0])
+
+    def check(self) -> None:
+        self.inst.read_pressure()
+
+    def query(self) -> list:  # every gauge, the emission and the filament in one round trip
+        res = self.inst.read_all()
+        pressures = dict(zip(res['labels'], res['pressures']))
+        return [pressures.get(x, np.nan) for x in self.gauges] + [res['emission'], res['filament']]
+
+
+class HeliumStabilizerDevice(Device):
+    name = 'Helium Stabilizer'
+    columns = [
+        'Time', 'SV1', 'SV2', 'MANUAL_OR_AUTO', 'P1(bar)',
+        'SETPOINT_A(bar)', 'SETPOINT_B(bar)', 'SETPOINT_C(bar)', 'COMPARE_PERIOD(ms)'
+    ]
+    dtypes = {'SV1': '<i4', 'SV2': '<i4', 'MANUAL_OR_AUTO': '<i4', 'COMPARE_PERIOD(ms)': '<i4'}
+    connection_errors = (OSError, RuntimeError)  # snap7 raises RuntimeError
+    plot_columns = ['P1(bar)']
+    ylabels = ['P1(bar)']
+    styles = ['.-']
+
+    def __init__(self, ip: str = '192.168.30.130', port: int = 102, interval: float = 2, settings: dict = None) -> None:
+        super().__init__(interval, settings)
+        self.ip = ip
+        self.port = port
+
+    def connect(self):
+        from lib.helium_stabilizer import HeliumStabilizer
+        return HeliumStabilizer(self.ip, auto_reconnect=False, tcp_port=self.port)
+
+    def check(self) -> None:
+        self.inst.snapshot()
+
+    def query(self) -> list:
+        snapshot = self.inst.snapshot()
+        return [
+            snapshot['sv1'], snapshot['sv2'], snapshot['manual_or_auto'], snapshot['pressure_1'],
+            snapshot['setpoint_a'], snapshot['setpoint_b'], snapshot['setpoint_c'],
+            snapshot['compare_period']
+        ]
+
+    def title(self, new_data: list) -> str:
+        return f'{new_data[0]}\n{new_data[1:4]}\n{new_data[5:9]}'
+
+
+class DeepVNADevice(Device):
+    name = 'DeepVNA'
+    columns = [
+        'Time', 'Center(Hz)', 'S11Center(dB)',
+        'CenterLeft3dB(Hz)', 'S11CenterLeft3dB(dB)',
+        'CenterRight3dB(Hz)', 'S11CenterRight3dB(dB)',
+        'FrqS11Max(Hz)', 'S11Max(dB)',
+        'QualityFactor(Unit)', 'Reflect(dB)'
+    ]
+    plot_columns = ['QualityFactor(Unit)', 'Reflect(dB)']
+    ylabels = ['Quality', 'Reflect(dB)']
+    styles = ['.-', '.-']
+
+    def __init__(self, serial_number: str = None, com: str = None, center: float = 41.96e6, span: float = 2e6,
+                 points: int = 301, track: bool = True, sampling_time: float = 2, interval: float = 4,
+                 settings: dict = None) -> None:
+        super().__init__(interval, settings)
+        self.serial_number = serial_number
+        self.com = com
+        self.center = center
+        self.span = span
+        self.points = points
+        self.track = track  # re-center and narrow the sweep on the notch, wide (center, span) sweep when it is lost
+        self.sampling_time = sampling_time
+        self.__tracker = None
+
+    def connect(self):
+        from lib.deepvna import DeepVNA
+        return DeepVNA(serial_number=self.serial_number, com=self.com)
+
+    def open(self) -> None:
+        from lib.deepvna import ResonanceTracker
+        super().open()
+        if self.track:
+            self.__tracker = ResonanceTracker(self.inst, self.center, self.span, self.points)
+        else:
+            self.inst.sweep(self.center, self.span, self.points)
+
+    def query(self) -> list:
+        from lib.deepvna import notch_fit
+        with self.timer.stage('acquire'):
+            frq, data = self.inst.acquire(self.sampling_time)
+        with self.timer.stage('analysis'):
+            s11 = self.inst.s11_db(data)
+            center, s11_center, center_left_3db, s11_left_3db, center_right_3db, s11_right_3db, frq_s11_max, s11_max = (
+                self.__tracker.update(frq, s11) if self.track else notch_fit(frq, s11))
+        quality = center / (center_right_3db - center_left_3db)
+        reflect = s11_center - s11_max
+        return [
+            center, s11_center,
+            center_left_3db, s11_left_3db,
+            center_right_3db, s11_right_3db,
+            frq_s11_max, s11_max,
+            quality, reflect
+        ]
+
+    def title(self, new_data: list) -> str:
+        return f'{new_data[0]}\n{float(new_data[1]) * 1e-6} MHz'
+
+    def close(self) -> None:
+        logging.info(f'{self.name}, sweep duration {self.inst.sweep_stats()}')
+        try:
+            self.inst.query('resume')
+        finally:  # a dead port is closed all the same, or it stays open and the reconnects fail
+            self.inst.close()
+
+
+class TC290Device(Device):
+    name = 'TC290'
+    columns = ['Time', 'A(K)', 'B(K)', 'C1(K)', 'D1(K)', 'C2(K)', 'D2(K)', 'C3(K)', 'D3(K)', 'C4(K)', 'D4(K)'] + [
+        f'OUTPUT {ch} {x}' for ch in (1, 2) for x in [
+            'SETPOINT(K)', 'MODE', 'INPUT CHANNEL', 'START AT BOOT', 'RANGE', 'P', 'I', 'D', 'HEATER OUTPUT(%)',
+            'CH2 OUTPUT MODE', 'RESISTANCE', 'MAX CURRENT', 'MAX CUSTOM CURRENT', 'DISPLAY MODE'
+        ]
+    ]
+    plot_columns = ['A(K)', 'B(K)', 'OUTPUT 1 HEATER OUTPUT(%)', 'OUTPUT 2 HEATER OUTPUT(%)']
+    ylabels = ['A(K)', 'B(K)', 'OUTPUT1(%)', 'OUTPUT2(%)']
+    styles = ['.-', '.-', 'v', 's']
+
+    def __init__(self, serial_number: str = None, com: str = None, interval: float = 1, config_interval: float = 10,
+                 verify_interval: float = 60, settings: dict = None) -> None:
+        super().__init__(interval, settings)
+        self.serial_number = serial_number
+        self.com = com
+        self.config_interval = config_interval  # OUTMODE, RANGE, PID and HTRSET, changes show up within it
+        self.verify_interval = verify_interval  # OUTMODE, RANGE, PID and HTRSET are served from a shadow
+        self.__poller = None
+
+    def connect(self):
+        from lib.config_cache import ConfigCache, TC290_SETTERS
+        from lib.tc290 import TC290
+        return ConfigCache(TC290(serial_number=self.serial_number, com=self.com), TC290_SETTERS, self.verify_interval)
+
+    def open(self) -> None:
+        super().open()
+        self.__poller = MultiRatePoller({  # one pipelined batch per rate
+            'fast': (partial(self.inst.query_many, ['KRDG?', 'HTR? 1', 'HTR? 2', 'SETP? 1', 'SETP? 2']),
+                     self.interval),
+            **{f'config_{ch}': (partial(self.__query_config, ch), self.config_interval) for ch in (1, 2)},
+        }, self.interval)
+
+    def __query_config(self, ch: int) -> (list, list):  # the columns before and after the heater output of ch
+        return ([*self.inst.query_output_parameters(ch), self.inst.query_output_range(ch),
+                 *self.inst.query_temperature_control_pid_parameters(ch)],
+                list(self.inst.query_heating_output_parameters(ch)))
+
+    def query(self) -> list:
+        with self.timer.stage('poll'):
+            fields = self.__poller.poll()
+        kelvin, heating_output, setpoints = fields['fast'][0], fields['fast'][1:3], fields['fast'][3:]
+        row = kelvin.split(',')
+        for i, ch in enumerate([1, 2]):
+            output, heater = fields[f'config_{ch}']
+            row += [setpoints[i], *output, heating_output[i], *heater]
+        return row
+
+    def close(self) -> None:
+        self.inst.stop()
+        self.inst.close()
+
+
+class Model336Device(Device):
+    name = 'Temprature Controller'
+    columns = [
+        'Time',
+        'T_A(K)', 'T_B(K)', 'T_C(K)', 'T_D1(K)', 'T_D2(K)', 'T_D3(K)',
+        'OUTPUT 1 INPUT CHANNEL', 'OUTPUT 1 SETPOINT(K)',
+        'OUTPUT 1 P', 'OUTPUT 1 I', 'OUTPUT 1 D',
+        'OUTPUT 1 HEATER RANGE', 'OUTPUT 1 HEATER OUTPUT 1(%)',
+        'OUTPUT 1 RESISTANCE', 'OUTPUT 1 MAX CURRENT(A)', 'OUTPUT 1 DISPLAY MODE',
+        'OUTPUT 2 INPUT CHANNEL', 'OUTPUT 2 SETPOINT(K)',
+        'OUTPUT 2 P', 'OUTPUT 2 I', 'OUTPUT 2 D',
+        'OUTPUT 2 HEATER RANGE', 'OUTPUT 2 HEATER OUTPUT 1(%)',
+        'OUTPUT 2 RESISTANCE', 'OUTPUT 2 MAX CURRENT(A)', 'OUTPUT 2 DISPLAY MODE'
+    ]
+    dtypes = {
+        c: '<i4' for c in columns
+        if c.endswith(('INPUT CHANNEL', 'HEATER RANGE', 'RESISTANCE', 'DISPLAY MODE'))
+    }  # enum values
+    plot_columns = [
+        'T_A(K)', 'T_B(K)', 'T_C(K)', 'T_D1(K)', 'T_D2(K)', 'T_D3(K)',
+        'OUTPUT 1 HEATER OUTPUT 1(%)', 'OUTPUT 2 HEATER OUTPUT 1(%)'
+    ]
+    ylabels = ['T1(K)', 'T2(K)', 'T3(K)', 'T4(K)', 'T5(K)',
+               'T6(K)', 'OUTPUT1(%)', 'OUTPUT2(%)']
+    styles = ['.-', '.-', '.-', '.-', '.-',
+              '.-', 'v', 's']
+    figsize = (30/2.54, 15/2.54)
+
+    def __init__(self, ip: str = '192.168.30.128', port: int = 7777, interval: float = 1, config_interval: float = 10,
+                 verify_interval: float = 60, settings: dict = None) -> None:
+        super().__init__(interval, settings)
+        self.ip = ip
+        self.port = port
+        self.config_interval = config_interval  # heater mode, pid, range and setup, changes show up within it
+        self.verify_interval = verify_interval  # heater mode, pid, range and setup are served from a shadow
+        self.__poller = None
+        self.__values = []
+
+    def connect(self):
+        from lakeshore import Model336
+        from lib.config_cache import ConfigCache, MODEL336_SETTERS
+        return ConfigCache(Model336(ip_address=self.ip, tcp_port=self.port), MODEL336_SETTERS, self.verify_interval)
+
+    def open(self) -> None:
+        super().open()
+        self.__poller = MultiRatePoller({
+            'kelvin': (self.inst.get_all_kelvin_reading, self.interval),
+            **{f'heater_output_{ch}': (partial(self.inst.get_heater_output, ch), self.interval) for ch in (1, 2)},
+            **{f'control_setpoint_{ch}': (partial(self.inst.get_control_setpoint, ch), self.interval)
+               for ch in (1, 2)},
+            **{f'{field}_{ch}': (partial(getattr(self.inst, f'get_{field}'), ch), self.config_interval)
+               for ch in (1, 2) for field in ['heater_output_mode', 'heater_pid', 'heater_range', 'heater_setup']}
+        }, self.interval)
+
+    def query(self) -> list:
+        with self.timer.stage('poll'):
+            fields = self.__poller.poll()
+        t1, t2, t3, t4, t5, t6, _, _ = fields['kelvin']
+        row, values = [t1, t2, t3, t4, t5, t6], [t1, t2, t3, t4, t5, t6]
+        for ch in [1, 2]:
+            output_mode = fields[f'heater_output_mode_{ch}']
+            setpoint = fields[f'control_setpoint_{ch}']
+            heater_pid = fields[f'heater_pid_{ch}']
+            heater_range = fields[f'heater_range_{ch}']
+            heater_output = fields[f'heater_output_{ch}']
+            heater_setup = fields[f'heater_setup_{ch}']
+            numbers = [setpoint, heater_pid['gain'], heater_pid['integral'], heater_pid['ramp_rate']]
+            enums = [output_mode['channel'], heater_range, heater_setup['heater_resistance']]
+            row += [enums[0].name, *numbers, enums[1].name, heater_output,
+                    enums[2].name, heater_setup['max_current'], heater_setup['output_display_mode'].name]
+            values += [enums[0].value, *numbers, enums[1].value, heater_output,
+                       enums[2].value, heater_setup['max_current'], heater_setup['output_display_mode'].value]
+        self.__values = values
+        return row
+
+    def values(self, row: list) -> list:  # enum values of the row just queried, same thread
+        return self.__values
+
+    def title(self, new_data: list) -> str:
+        return f'{new_data[0]}\n{new_data[7:13]}\n{new_data[17:23]}'
+
+    def close(self) -> None:
+        self.inst.stop()
+        self.inst.disconnect_tcp()
@@ -1,41 +1,114 @@
 import socket
+import threading
+from collections import deque
 from matplotlib import pyplot as plt
 import numpy as np
 import time
 
 
 class DL7:
-    
-    def __init__(self, ip: str = '192.168.30.131') -> None:
+    """
+    DL7 streams 'N.N  E - N Pa\\r' frames on its own. A reader thread consumes the socket
+    continuously and keeps every frame as a (time, pressure) sample in a bounded buffer:
+    get_pressure() returns the latest one, read_new() every sample since its last call and
+    capture() every sample of the next duration seconds.
+    """
+
+    def __init__(self, ip: str = '192.168.30.131', port: int = 8234, buffer_size: int = 100000,
+                 timeout: float = 2.) -> None:
         self.__ip = ip
         self.__client = socket.socket()
-        self.__client.connect((self.__ip, 8234))
-        self.__recv_cache = b''  # len = 14, fmt = N.N  E - N Pa\r
-        self.init_recv_cache()
-    
+        self.__client.settimeout(timeout)
+        self.__client.connect((self.__ip, port))
+        self.timeout = timeout
+        self.__samples = deque(maxlen=buffer_size)  # (time, pressure)
+        self.__count = 0  # samples received
+        self.__read_count = 0  # samples returned by read_new
+        self.__period = None  # estimated frame period (s)
+        self.__last_time = None  # of the latest sample
+        self.__new_sample = threading.Condition()
+        self.__running = True
+        self.__thread = threading.Thread(target=self.__read_loop, daemon=True)
+        self.__thread.start()
+
     def close(self) -> None:
+        self.__running = False
+        try:
+            self.__client.shutdown(socket.SHUT_RDWR)  # wakes the reader
+        except OSError:
+            pass
+        self.__thread.join()
         self.__client.close()
-        
-    def init_recv_cache(self) -> None:  # deal with first data is incomplete
-        time.sleep(1)
-        self.__recv_cache += self.__client.recv(256)
-        term_pos = self.__recv_cache.find(b'\r')
-        if term_pos not in (-1, 13):
-            self.__recv_cache = self.__recv_cache[term_pos+1:]
-
-    def get_pressure(self) -> str:  # unit is Pa
-        self.__recv_cache += self.__client.recv(256)
-        last_term_pos = self.__recv_cache.rfind(b'\r')
-        if not last_term_pos == -1:
-            last_data = self.__recv_cache[last_term_pos-13:last_term_pos+1]
-            pressure = last_data[:-3].decode().replace(' ', '')
-            self.__recv_cache = self.__recv_cache[last_term_pos+1:]
-            return pressure
-        else:
-            return '0'
+
+    def __read_loop(self) -> None:
+        recv_cache = b''
+        while self.__running:
+            try:
+                recv = self.__client.recv(4096)
+            except socket.timeout:
+                continue
+            except OSError:  # closed
+                break
+            if not recv:
+                break
+            t = time.time()
+            *frames, recv_cache = (recv_cache + recv).split(b'\r')
+            pressures = []
+            for frame in frames:
+                pressure = frame[:-2].decode(errors='replace').replace(' ', '')
+                try:
+                    float(pressure)
+                except ValueError:  # the first frame may be incomplete
+                    continue
+                pressures.append(pressure)
+            samples = list(zip(self.__stamps(t, len(pressures)), pressures))
+            with self.__new_sample:
+                self.__samples.extend(samples)
+                self.__count += len(samples)
+                self.__new_sample.notify_all()
+
+    def __stamps(self, t: float, n: int) -> list[float]:
+        # the n frames of one recv() arrived together at t, spread back by the frame period, never before the last one
+        if not n:
+            return []
+        if self.__last_time is not None and (period := (t - self.__last_time) / n) < self.timeout:  # not over a pause
+            self.__period = period if self.__period is None else 0.9 * self.__period + 0.1 * period
+        stamps = [t - (n - 1 - i) * (self.__period or 0.) for i in range(n)]
+        if self.__last_time is not None:
+            stamps = [max(x, self.__last_time) for x in stamps]
+        self.__last_time = t
+        return stamps
+
+    def get_pressure(self) -> str:  # unit is Pa, the latest sample, waits for one no older than timeout
+        with self.__new_sample:
+            if not self.__new_sample.wait_for(
+                    lambda: self.__samples and time.time() - self.__samples[-1][0] < self.timeout, self.timeout):
+                raise TimeoutError(f'DL7 {self.__ip}, no frame in {self.timeout} s')
+            return self.__samples[-1][1]
+
+    def read_new(self) -> list[tuple[float, str]]:  # every (time, pressure) since the last call, bounded by buffer_size
+        with self.__new_sample:
+            n = min(self.__count - self.__read_count, len(self.__samples))
+            self.__read_count = self.__count
+            return list(self.__samples)[len(self.__samples) - n:]
+
+    def capture(self, duration: float) -> (np.ndarray, np.ndarray):  # times and pressures of the next duration seconds
+        with self.__new_sample:
+            start = self.__count
+        time.sleep(duration)
+        with self.__new_sample:
+            n = min(self.__count - start, len(self.__samples))
+            samples = list(self.__samples)[len(self.__samples) - n:]
+        return np.array([t for t, _ in samples]), np.array([float(p) for _, p in samples])
 
 
 if __name__ == '__main__':
     dl7 = DL7()
     print(dl7.get_pressure())
-    dl7.close()
\ No newline at end of file
+    t, p = dl7.capture(5)
+    print(f'{len(t) / 5} samples/s')
+    plt.plot(t - t[0], p, '.-')
+    plt.xlabel('t(s)')
+    plt.ylabel('Pressure(Pa)')
+    plt.show()
+    dl7.close()
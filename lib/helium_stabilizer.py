@@ -1,18 +1,43 @@
+import time
 import snap7
 import struct
+import logging
 from snap7.util import Areas
 
+from lib.register_map import Register, RegisterMap
+
 
 rack = 0
 slot = 1
 P_MAX = 1.068  # unit is bar
+REGISTERS = RegisterMap({
+    'sv1': Register(Areas.MK, 2, 'b', bit=0),  # M2.0
+    'sv2': Register(Areas.MK, 2, 'b', bit=1),  # M2.1
+    'manual_or_auto': Register(Areas.MK, 3, 'b', decode=lambda x: 1 if x == 5 else 0),  # M3
+    'pressure_1': Register(Areas.MK, 116, 'f', ndigits=6),  # MD116
+    'setpoint_a': Register(Areas.MK, 100, 'f', ndigits=4),  # MD100
+    'setpoint_b': Register(Areas.MK, 104, 'f', ndigits=4),  # MD104
+    'setpoint_c': Register(Areas.MK, 108, 'f', ndigits=4),  # MD108
+    'compare_period': Register(Areas.MK, 112, 'i'),  # MD112, unit is ms
+})
 
 
 class HeliumStabilizer():
-
-    def __init__(self, ip='192.168.30.130') -> None:
+    """
+    auto_reconnect: a failed read returns -1 and reconnects, at most once per reconnect_holdoff
+    seconds however many getters fail. False raises the RuntimeError of snap7 instead, for a
+    caller that supervises the connection itself (lib/supervisor.py). tcp_port other than 102
+    is for lib/simulators.py.
+    """
+
+    def __init__(self, ip='192.168.30.130', auto_reconnect: bool = True, reconnect_holdoff: float = 5.,
+                 tcp_port: int = 102) -> None:
         self.__ip = ip
+        self.__tcp_port = tcp_port
         self.__client = snap7.client.Client()
+        self.auto_reconnect = auto_reconnect
+        self.reconnect_holdoff = reconnect_holdoff
+        self.__last_reconnect = -reconnect_holdoff
         self.reconnect()
 
     def close(self) -> None:
@@ -20,79 +45,58 @@ class HeliumStabilizer():
     
     def reconnect(self) -> None:
         self.close()
-        self.__client.connect(self.__ip, rack=rack, slot=slot)
+        self.__client.connect(self.__ip, rack, slot, self.__tcp_port)  # positional, tcpport in python-snap7 < 2
         
-    def get_sv1(self) -> int:
+    def __recover(self) -> None:
+        if time.monotonic() - self.__last_reconnect < self.reconnect_holdoff:
+            return
+        self.__last_reconnect = time.monotonic()
         try:
-            M2 = struct.unpack(
-                'b', self.__client.read_area(Areas.MK, 0, 2, 1))[0]
-            return 1 if M2 & 1 else 0
-        except RuntimeError:
             self.reconnect()
-            return -1
+        except RuntimeError:
+            logging.warning(f'HeliumStabilizer {self.__ip}, Reconnect Failed')
 
-    def get_sv2(self) -> int:
+    def __read(self, name: str):
         try:
-            M2 = struct.unpack(
-                'b', self.__client.read_area(Areas.MK, 0, 2, 1))[0]
-            return 1 if M2 >> 1 & 1 else 0
+            return REGISTERS.read(self.__client, name)
         except RuntimeError:
-            self.reconnect()
+            if not self.auto_reconnect:
+                raise
+            self.__recover()
             return -1
 
-    def get_pressure_1(self) -> float:
+    def snapshot(self) -> dict:  # every register in one read_area
         try:
-            MD116 = struct.unpack(
-                '>f', self.__client.read_area(Areas.MK, 0, 116, 4))[0]
-            return round(MD116, 6)
+            return REGISTERS.snapshot(self.__client)
         except RuntimeError:
-            self.reconnect()
-            return -1
+            if not self.auto_reconnect:
+                raise
+            self.__recover()
+            return dict.fromkeys(REGISTERS.registers, -1)
+
+    def get_sv1(self) -> int:
+        return self.__read('sv1')
+
+    def get_sv2(self) -> int:
+        return self.__read('sv2')
+
+    def get_pressure_1(self) -> float:
+        return self.__read('pressure_1')
 
     def get_setpoint_a(self) -> float:
-        try:
-            MD100 = struct.unpack(
-                '>f', self.__client.read_area(Areas.MK, 0, 100, 4))[0]
-            return round(MD100, 4)
-        except RuntimeError:
-            self.reconnect()
-            return -1
+        return self.__read('setpoint_a')
 
     def get_setpoint_b(self) -> float:
-        try:
-            MD104 = struct.unpack(
-                '>f', self.__client.read_area(Areas.MK, 0, 104, 4))[0]
-            return round(MD104, 4)
-        except RuntimeError:
-            self.reconnect()
-            return -1
+        return self.__read('setpoint_b')
 
     def get_setpoint_c(self) -> float:
-        try:
-            MD108 = struct.unpack(
-                '>f', self.__client.read_area(Areas.MK, 0, 108, 4))[0]
-            return round(MD108, 4)
-        except RuntimeError:
-            self.reconnect()
-            return -1
+        return self.__read('setpoint_c')
 
     def get_compare_period(self) -> int:
-        try:
-            MD112 = struct.unpack(
-                '>i', self.__client.read_area(Areas.MK, 0, 112, 4))[0]  # unit is ms
-            return MD112
-        except RuntimeError:
-            self.reconnect()
-            return -1
+        return self.__read('compare_period')
 
     def get_manual_or_auto(self) -> int:
-        try:
-            M3 = struct.unpack(
-                'b', self.__client.read_area(Areas.MK, 0, 3, 1))[0]
-            return 1 if M3 == 5 else 0
-        except RuntimeError:
-            self.reconnect()
-            return -1
+        return self.__read('manual_or_auto')
 
     def set_sv1(self, val: int) -> None:
         M2 = struct.unpack('b', self.__client.read_area(Areas.MK, 0, 2, 1))[0]
@@ -145,6 +149,7 @@ class HeliumStabilizer():
 if __name__ == '__main__':
     instrument_ip = '192.168.30.130'
     hs = HeliumStabilizer(instrument_ip)
+    print(hs.snapshot())
     print(hs.get_pressure_1())
     print(hs.get_sv1())
     print(hs.get_sv2())
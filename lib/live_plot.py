@@ -0,0 +1,91 @@
+import numpy as np
+import matplotlib.pyplot as plt
+import matplotlib.colors as mcolors
+
+
+class LivePlot:
+    """
+    One line per y axis, the first axis owns x and the others are twinx with outward spines.
+    Axes, lines and legend are created once; update() sets line data and blits the lines and
+    title over a cached background. The figure is fully redrawn only when data leaves the
+    axis limits (or fills less than shrink of them), the title changes height or the window
+    is resized.
+    """
+
+    def __init__(self, name: str, ylabels: list[str], styles: list[str], xlabel: str = 't(s)',
+                 figsize: tuple = (12/2.54, 9/2.54), ax_gap: int = 55,
+                 margin: float = 0.1, shrink: float = 0.25) -> None:
+        self.__margin = margin
+        self.__shrink = shrink
+        self.__fig, ax1 = plt.subplots(figsize=figsize)
+        self.__fig.canvas.manager.set_window_title(name)
+        self.__axs = [ax1] + [ax1.twinx() for _ in ylabels[1:]]
+        self.__lines = []
+        colors = list(mcolors.TABLEAU_COLORS)
+        for i, ax in enumerate(self.__axs):
+            ax.spines['left'].set_color(colors[0])
+            ax.spines['right'].set_color(colors[i])
+            ax.tick_params(axis='y', color=colors[i], labelcolor=colors[i])
+            ax.spines['right'].set_position(('outward', ax_gap*(i-1) if i > 1 else 0))
+            ax.ticklabel_format(useOffset=False)
+            line, = ax.plot([], [], styles[i], c=colors[i], label=ylabels[i], animated=True)
+            self.__lines.append(line)
+        ax1.set_xlabel(xlabel)
+        self.__title = ax1.set_title('', animated=True)
+        self.__title_height = -1
+        self.__fig.legend(handles=self.__lines, loc=2, bbox_to_anchor=(0, 1),
+                          bbox_transform=ax1.transAxes, framealpha=0.1)
+        self.__background = None
+        self.__fig.canvas.mpl_connect('draw_event', self.__on_draw)
+        plt.show(block=False)
+
+    def __on_draw(self, event) -> None:
+        self.__background = self.__fig.canvas.copy_from_bbox(self.__fig.bbox)
+        self.__draw_animated()
+
+    def __draw_animated(self) -> None:
+        for artist in self.__lines + [self.__title]:
+            self.__fig.draw_artist(artist)
+
+    def __rescale(self, lim: tuple, data: np.ndarray) -> tuple:
+        # new limits, or None while the data fits the current ones
+        data = data[np.isfinite(data)]
+        if len(data) == 0:
+            return None
+        lo, hi = data.min(), data.max()
+        if lim[0] <= lo and hi <= lim[1] and hi - lo >= self.__shrink * (lim[1] - lim[0]):
+            return None
+        pad = (hi - lo) * self.__margin or abs(hi) * self.__margin or 1
+        return lo - pad, hi + pad
+
+    def exists(self) -> bool:
+        return plt.fignum_exists(self.__fig.number)
+
+    def update(self, x: np.ndarray, ys: list[np.ndarray], title: str = '') -> None:
+        redraw = self.__background is None or not self.__fig.canvas.supports_blit
+        for line, y in zip(self.__lines, ys):
+            line.set_data(x, y)
+        self.__title.set_text(title)
+        if title.count('\n') != self.__title_height:
+            self.__title_height = title.count('\n')
+            self.__fig.tight_layout()
+            redraw = True
+        xlim = self.__rescale(self.__axs[0].get_xlim(), np.asarray(x, float))
+        if xlim:
+            self.__axs[0].set_xlim(xlim)
+            redraw = True
+        for ax, y in zip(self.__axs, ys):
+            ylim = self.__rescale(ax.get_ylim(), np.asarray(y, float))
+            if ylim:
+                ax.set_ylim(ylim)
+                redraw = True
+        if redraw:
+            self.__fig.canvas.draw()
+        else:
+            self.__fig.canvas.restore_region(self.__background)
+            self.__draw_animated()
+        self.__fig.canvas.blit(self.__fig.bbox)
+        self.__fig.canvas.flush_events()
+
+    def pause(self, interval: float) -> None:  # unlike plt.pause, does not force a full redraw
+        self.__fig.canvas.start_event_loop(interval)
@@ -0,0 +1,118 @@
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Latest values and loop health of the devices for dashboards and alerting, in the Prometheus text
+# format on http://host:port/metrics. The acquisition loops push into the snapshot, a scrape only
+# renders it and never touches an instrument or the data files.
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+METRICS = [  # name, type, help
+    ('value', 'gauge', 'Latest value of an instrument channel, NaN while the device is down.'),
+    ('last_sample_timestamp_seconds', 'gauge', 'Time of the latest sample.'),
+    ('cycle_seconds', 'gauge', 'Duration of the latest acquisition cycle.'),
+    ('cycles_total', 'counter', 'Acquisition cycles.'),
+    ('up', 'gauge', '1 while the device is connected.'),
+    ('failures_total', 'counter', 'Failed queries.'),
+    ('reconnects_total', 'counter', 'Successful reconnects.'),
+]
+
+
+def escape(label: str) -> str:
+    return label.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def number(x) -> float:  # None for values without a number, e.g. the enum names of a row
+    try:
+        return float(x)
+    except (TypeError, ValueError):
+        return None
+
+
+def format_number(x: float) -> str:
+    return 'NaN' if math.isnan(x) else '+Inf' if x == math.inf else '-Inf' if x == -math.inf else repr(x)
+
+
+class Metrics:
+    """
+    In-memory snapshot of every device: update() after each cycle with the values of the row,
+    health() with the counters of its Supervisor, failure() counts a failed cycle of a loop
+    without one. serve() answers scrapes from a background thread.
+    """
+
+    def __init__(self, prefix: str = 'cryostat') -> None:
+        self.prefix = prefix
+        self.__lock = threading.Lock()
+        self.__devices = {}  # name -> {'channels': {channel: value}, metric: value}
+        self.__server = None
+
+    def __device(self, name: str) -> dict:
+        if name not in self.__devices:
+            self.__devices[name] = {'channels': {}, 'cycles_total': 0, 'failures_total': 0}
+        return self.__devices[name]
+
+    def update(self, name: str, columns: list, values: list, timestamp: float = None, cycle_time: float = None) -> None:
+        channels = {c: x for c, v in zip(columns, values) if (x := number(v)) is not None}
+        with self.__lock:
+            device = self.__device(name)
+            device['channels'].update(channels)
+            device['cycles_total'] += 1
+            if timestamp is not None:
+                device['last_sample_timestamp_seconds'] = timestamp
+            if cycle_time is not None:
+                device['cycle_seconds'] = cycle_time
+
+    def health(self, name: str, up: bool = None, failures: int = None, reconnects: int = None) -> None:
+        with self.__lock:
+            device = self.__device(name)
+            for metric, x in [('up', up), ('failures_total', failures), ('reconnects_total', reconnects)]:
+                if x is not None:
+                    device[metric] = int(x)
+
+    def failure(self, name: str) -> None:
+        with self.__lock:
+            self.__device(name)['failures_total'] += 1
+
+    def render(self) -> bytes:
+        lines = []
+        with self.__lock:
+            for metric, metric_type, help_text in METRICS:
+                lines += [f'# HELP {self.prefix}_{metric} {help_text}', f'# TYPE {self.prefix}_{metric} {metric_type}']
+                for name, device in self.__devices.items():
+                    if metric == 'value':
+                        lines += [f'{self.prefix}_value{{device="{escape(name)}",channel="{escape(c)}"}} {format_number(x)}'
+                                  for c, x in device['channels'].items()]
+                    elif metric in device:
+                        lines.append(f'{self.prefix}_{metric}{{device="{escape(name)}"}} {format_number(device[metric])}')
+        return ('\n'.join(lines) + '\n').encode()
+
+    def serve(self, port: int = 9100, host: str = '') -> int:  # returns the bound port
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split('?')[0] not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = metrics.render()
+                self.send_response(200)
+                self.send_header('Content-Type', CONTENT_TYPE)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:  # no line per scrape on stderr
+                pass
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever, name='metrics', daemon=True).start()
+        return self.__server.server_address[1]
+
+    def close(self) -> None:
+        if self.__server:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
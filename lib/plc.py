@@ -2,6 +2,21 @@ import snap7
 import struct
 from snap7.util import Areas
 
+from lib.register_map import Register, RegisterMap
+
+
+REGISTERS = RegisterMap({
+    'sv1': Register(Areas.PA, 0, 'b', bit=0),  # Q0.0
+    'sv2': Register(Areas.PA, 0, 'b', bit=1),  # Q0.1
+    'manual_or_auto': Register(Areas.MK, 3, 'b', bit=0),  # M3.0
+    'p01': Register(Areas.MK, 116, 'f'),  # MD116
+    'setpoint_a': Register(Areas.MK, 100, 'f'),  # MD100
+    'setpoint_b': Register(Areas.MK, 104, 'f'),  # MD104
+    'setpoint_c': Register(Areas.MK, 108, 'f'),  # MD108
+    'setpoint_d': Register(Areas.MK, 112, 'f'),  # MD112
+    't1': Register(Areas.MK, 124, 'f'),  # MD124
+})
+
 
 def check_setpoint_range(min_val: float, max_val: float):
     def decorator(func):
@@ -14,20 +29,21 @@ def check_setpoint_range(min_val: float, max_val: float):
 
 class PLC():
 
-    def __init__(self, ip: str, rack: int = 0, slot: int = 1) -> None:
+    def __init__(self, ip: str, rack: int = 0, slot: int = 1, tcp_port: int = 102) -> None:
         self.__client = snap7.client.Client()
-        self.__client.connect(address=ip, rack=rack, slot=slot)
+        self.__client.connect(ip, rack, slot, tcp_port)
 
     def close(self) -> None:
         self.__client.disconnect()
         
+    def snapshot(self) -> dict:  # every register in one read_multi_vars
+        return REGISTERS.snapshot(self.__client)
+
     def get_sv1(self) -> int:
-        Q0 = struct.unpack('b', self.__client.read_area(Areas.PA, 0, 0, 1))[0]
-        return 1 if Q0 & 1 else 0
+        return REGISTERS.read(self.__client, 'sv1')
 
     def get_sv2(self) -> int:
-        Q0 = struct.unpack('b', self.__client.read_area(Areas.PA, 0, 0, 1))[0]
-        return 1 if Q0 >> 1 & 1 else 0
+        return REGISTERS.read(self.__client, 'sv2')
     
     def switch_sv1(self) -> None:
         M2 = struct.unpack('b', self.__client.read_area(Areas.MK, 0, 2, 1))[0]
@@ -52,28 +68,22 @@ class PLC():
             self.switch_sv2()
 
     def get_p01(self) -> float:
-        MD116 = struct.unpack('>f', self.__client.read_area(Areas.MK, 0, 116, 4))[0]
-        return MD116
+        return REGISTERS.read(self.__client, 'p01')
 
     def get_setpoint_a(self) -> float:
-        MD100 = struct.unpack('>f', self.__client.read_area(Areas.MK, 0, 100, 4))[0]
-        return MD100
+        return REGISTERS.read(self.__client, 'setpoint_a')
 
     def get_setpoint_b(self) -> float:
-        MD104 = struct.unpack('>f', self.__client.read_area(Areas.MK, 0, 104, 4))[0]
-        return MD104
+        return REGISTERS.read(self.__client, 'setpoint_b')
 
     def get_setpoint_c(self) -> float:
-        MD108 = struct.unpack('>f', self.__client.read_area(Areas.MK, 0, 108, 4))[0]
-        return MD108
+        return REGISTERS.read(self.__client, 'setpoint_c')
 
     def get_setpoint_d(self) -> float:
-        MD112 = struct.unpack('>f', self.__client.read_area(Areas.MK, 0, 112, 4))[0]
-        return MD112
+        return REGISTERS.read(self.__client, 'setpoint_d')
 
     def get_t1(self) -> float:
-        MD124 = struct.unpack('>f', self.__client.read_area(Areas.MK, 0, 124, 4))[0]
-        return MD124
+        return REGISTERS.read(self.__client, 't1')
 
     @check_setpoint_range(0, 300)  # unit is K
     def set_setpoint_a(self, val: float) -> None:
@@ -95,8 +105,7 @@ class PLC():
         self.__client.write_area(Areas.MK, 0, 124, bytearray(struct.pack('>f', val)))
 
     def get_manual_or_auto(self) -> int:
-        M3 = struct.unpack('b', self.__client.read_area(Areas.MK, 0, 3, 1))[0]
-        return 1 if M3 & 1 else 0
+        return REGISTERS.read(self.__client, 'manual_or_auto')
 
     def set_manual_or_auto(self, val: int) -> None:
         # manual = 0, auto = 1
@@ -106,6 +115,7 @@ class PLC():
 
 if __name__ == '__main__':
     inst = PLC(ip='192.168.21.10')
+    print(inst.snapshot())
     print(inst.get_p01())
     # inst.switch_sv1()
     # inst.switch_sv2()
@@ -0,0 +1,40 @@
+from typing import Callable
+
+
+class MultiRatePoller:
+    """
+    Polls each field at its own rate on top of one base interval.
+    fields maps a name to (read, field_interval); poll() is called every interval seconds,
+    reads the fields that are due (every round(field_interval / interval) calls, all of them
+    on the first call) and returns the last known value of every field.
+    """
+
+    def __init__(self, fields: dict[str, tuple[Callable, float]], interval: float) -> None:
+        self.__fields = {name: (read, max(1, round(field_interval / interval)))
+                         for name, (read, field_interval) in fields.items()}
+        self.__count = 0
+        self.__due = set(self.__fields)
+        self.values = {}
+
+    def invalidate(self, name: str = None) -> None:  # read on the next poll, e.g. after a set_*
+        self.__due.update([name] if name else self.__fields)
+
+    def poll(self) -> dict:
+        for name, (read, every) in self.__fields.items():
+            if name in self.__due or self.__count % every == 0:
+                self.values[name] = read()
+                self.__due.discard(name)
+        self.__count += 1
+        return self.values
+
+
+if __name__ == '__main__':
+    reads = {'fast': 0, 'slow': 0}
+
+    def read(name: str) -> int:
+        reads[name] += 1
+        return reads[name]
+
+    poller = MultiRatePoller({'fast': (lambda: read('fast'), 1), 'slow': (lambda: read('slow'), 10)}, 1)
+    for i in range(12):
+        print(i, poller.poll())
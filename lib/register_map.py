@@ -0,0 +1,90 @@
+import ctypes
+import struct
+from typing import Callable, NamedTuple
+
+
+class Register(NamedTuple):
+    area: object  # snap7 Areas
+    offset: int  # byte offset in the area
+    fmt: str  # struct format of the value, S7 is big-endian
+    bit: int = None  # e.g. 1 for M2.1
+    scale: float = None
+    ndigits: int = None  # round() digits
+    decode: Callable = None  # applied last, e.g. lambda x: 1 if x == 5 else 0
+
+
+def read_multi(client, spans: list[tuple]) -> bytes:
+    # one read_multi_vars for several (area, start, size) byte spans
+    try:
+        from snap7.type import S7DataItem, WordLen
+        word_len = WordLen.Byte.value
+    except ImportError:  # python-snap7 < 2
+        from snap7.types import S7DataItem, S7WLByte as word_len
+    items = (S7DataItem * len(spans))()
+    buffers = []
+    for item, (area, start, size) in zip(items, spans):
+        buffer = ctypes.create_string_buffer(size)
+        item.Area = ctypes.c_int32(area.value)
+        item.WordLen = ctypes.c_int32(word_len)
+        item.Result = ctypes.c_int32(0)
+        item.DBNumber = ctypes.c_int32(0)
+        item.Start = ctypes.c_int32(start)
+        item.Amount = ctypes.c_int32(size)
+        item.pData = ctypes.cast(ctypes.pointer(buffer), ctypes.POINTER(ctypes.c_uint8))
+        buffers.append(buffer)
+    _, items = client.read_multi_vars(items)
+    for item, (area, start, size) in zip(items, spans):
+        if item.Result:
+            raise RuntimeError(f'read_multi_vars {area} {start} {size} failed with {item.Result}')
+    return b''.join(buffer.raw for buffer in buffers)
+
+
+class RegisterMap:
+    """
+    Declarative description of the values of a PLC. snapshot() reads every area as one
+    contiguous byte span, with one read_area for a single area or one read_multi_vars across
+    areas, and decodes all of it with one precompiled struct. Registers sharing a byte
+    (bits of M2) are unpacked once.
+    """
+
+    def __init__(self, registers: dict[str, Register]) -> None:
+        self.registers = registers
+        self.spans = []  # (area, start, size)
+        fields = {}  # (area, offset, fmt) -> index in the unpacked tuple
+        fmt = '>'
+        for area in dict.fromkeys(r.area for r in registers.values()):
+            area_fields = sorted({(r.offset, r.fmt) for r in registers.values() if r.area == area})
+            start = pos = area_fields[0][0]
+            for offset, field_fmt in area_fields:
+                if offset < pos:
+                    raise ValueError(f'{area} {offset} overlaps the previous register')
+                fmt += f'{offset - pos}x{field_fmt}'
+                fields[(area, offset, field_fmt)] = len(fields)
+                pos = offset + struct.calcsize(f'>{field_fmt}')
+            self.spans.append((area, start, pos - start))
+        self.__struct = struct.Struct(fmt)
+        self.__index = {name: fields[(r.area, r.offset, r.fmt)] for name, r in registers.items()}
+
+    def decode(self, name: str, val):
+        r = self.registers[name]
+        if r.bit is not None:
+            val = val >> r.bit & 1
+        if r.scale is not None:
+            val *= r.scale
+        if r.ndigits is not None:
+            val = round(val, r.ndigits)
+        return r.decode(val) if r.decode else val
+
+    def snapshot(self, client) -> dict:
+        if len(self.spans) == 1:
+            area, start, size = self.spans[0]
+            data = client.read_area(area, 0, start, size)
+        else:
+            data = read_multi(client, self.spans)
+        vals = self.__struct.unpack(bytes(data))
+        return {name: self.decode(name, vals[i]) for name, i in self.__index.items()}
+
+    def read(self, client, name: str):  # a single register with its own read_area
+        r = self.registers[name]
+        data = client.read_area(r.area, 0, r.offset, struct.calcsize(f'>{r.fmt}'))
+        return self.decode(name, struct.unpack(f'>{r.fmt}', data)[0])
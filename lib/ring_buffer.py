@@ -0,0 +1,46 @@
+import numpy as np
+
+
+class RingBuffer:
+    """
+    Fixed-capacity cache of float64 epoch timestamps and typed channels.
+    Every row is written twice, at i and i + capacity, so the cached rows are always one
+    contiguous, time-ordered slice and times() / buf[column] return views without copying.
+    The views are valid until the next append.
+    """
+
+    def __init__(self, capacity: int, columns: list, dtypes: dict = None) -> None:
+        dtypes = dtypes or {}
+        self.__capacity = capacity
+        self.__time = np.zeros(2 * capacity)
+        self.__data = {c: np.zeros(2 * capacity, dtypes.get(c, np.float64)) for c in columns}
+        self.__next = 0
+        self.__len = 0
+
+    def __len__(self) -> int:
+        return self.__len
+
+    def __slice(self) -> slice:
+        start = (self.__next - self.__len) % self.__capacity
+        return slice(start, start + self.__len)
+
+    def append(self, t: float, new_data: list) -> None:
+        i, j = self.__next, self.__next + self.__capacity
+        self.__time[i] = self.__time[j] = t
+        for column, val in zip(self.__data.values(), new_data):
+            column[i] = column[j] = val
+        self.__next = (i + 1) % self.__capacity
+        self.__len = min(self.__len + 1, self.__capacity)
+
+    def times(self) -> np.ndarray:
+        return self.__time[self.__slice()]
+
+    def __getitem__(self, column: str) -> np.ndarray:
+        return self.__data[column][self.__slice()]
+
+
+if __name__ == '__main__':
+    buf = RingBuffer(4, ['P'])
+    for i in range(6):
+        buf.append(i, [i * 10])
+    print(buf.times(), buf['P'])
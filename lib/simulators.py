@@ -0,0 +1,509 @@
+import os
+import time
+import socket
+import struct
+import ctypes
+import logging
+import threading
+import numpy as np
+from functools import partial
+
+
+# Stand-ins for the lab instruments speaking their wire protocols, for running the drivers,
+# monitors and benchmarks off-site. latency is added before every reply (s), noise is the
+# relative standard deviation of the simulated readings.
+
+
+def shutdown(sock: socket.socket) -> None:  # close() alone does not wake a thread blocked in accept() or recv()
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:  # not connected
+        pass
+    sock.close()
+
+
+def free_port(host: str = '127.0.0.1') -> int:  # for servers that cannot bind port 0 themselves (snap7)
+    with socket.socket() as s:
+        s.bind((host, 0))
+        return s.getsockname()[1]
+
+
+class LineSimulator:
+    """
+    Base of the request/response simulators. Requests are framed by terminator, respond()
+    returns the reply bytes (None for no reply) and every reply is delayed by latency. One
+    simulator serves any number of TCP clients (serve_tcp) and pseudo terminals (serve_pty, POSIX).
+    """
+    terminator = b'\r'
+
+    def __init__(self, latency: float = 0.002, noise: float = 0.01, seed: int = None) -> None:
+        self.latency = latency
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.requests = 0
+        self._stop = threading.Event()
+        self._closers = []
+        self._threads = []  # accept loops, joined by stop()
+
+    def jitter(self, x: float) -> float:
+        return x * (1 + self.noise * self.rng.standard_normal())
+
+    def respond(self, request: bytes) -> bytes:
+        raise NotImplementedError
+
+    def _handle(self, buf: bytearray) -> bytes:  # consumes whole requests of buf, returns the replies
+        out = b''
+        while (i := buf.find(self.terminator)) >= 0:
+            request = bytes(buf[:i]).strip()
+            del buf[:i + len(self.terminator)]
+            if not request:
+                continue
+            self.requests += 1
+            if self.latency:
+                time.sleep(self.latency)
+            out += self.respond(request) or b''
+        return out
+
+    def _spawn(self, target, *args) -> threading.Thread:
+        thread = threading.Thread(target=target, args=args, daemon=True)
+        thread.start()
+        return thread
+
+    def serve_tcp(self, port: int = 0, host: str = '127.0.0.1') -> int:  # returns the bound port
+        server = socket.create_server((host, port))
+        self._closers.append(partial(shutdown, server))
+
+        def accept():
+            while not self._stop.is_set():
+                try:
+                    conn, _ = server.accept()
+                except OSError:
+                    return
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                self._closers.append(partial(shutdown, conn))
+                self._spawn(self._serve_conn, conn)
+
+        self._threads.append(self._spawn(accept))
+        return server.getsockname()[1]
+
+    def _serve_conn(self, conn: socket.socket) -> None:
+        buf = bytearray()
+        with conn:
+            while not self._stop.is_set():
+                try:
+                    recv = conn.recv(4096)
+                except OSError:
+                    return
+                if not recv:
+                    return
+                buf += recv
+                if out := self._handle(buf):
+                    try:
+                        conn.sendall(out)
+                    except OSError:  # closed by stop()
+                        return
+
+    def serve_pty(self) -> str:  # returns the device path of the serial side
+        import tty
+        master, slave = os.openpty()
+        tty.setraw(slave)
+        self._closers += [lambda: os.close(master), lambda: os.close(slave)]
+
+        def serve():
+            buf = bytearray()
+            while not self._stop.is_set():
+                try:
+                    buf += os.read(master, 4096)
+                except OSError:
+                    return
+                if out := self._handle(buf):
+                    try:
+                        os.write(master, out)
+                    except OSError:
+                        return
+
+        self._spawn(serve)
+        return os.ttyname(slave)
+
+    def stop(self) -> None:
+        self._stop.set()
+        for close in self._closers:
+            try:
+                close()
+            except OSError:
+                pass
+        for thread in self._threads:
+            thread.join()
+
+
+class XGS600Simulator(LineSimulator):
+    """
+    '#00' commands of the XGS600, gauges maps a user label to its pressure (Pa), None for a
+    board without a cable. The ion gauge (first label) reads 'OFF' while its emission is off.
+    """
+    terminator = b'\r'
+
+    def __init__(self, gauges: dict = None, latency: float = 0.002, noise: float = 0.01, seed: int = None) -> None:
+        super().__init__(latency, noise, seed)
+        self.gauges = gauges or {'HFIG1': 1.2e-8, 'CNV1': 2.5e-1, 'CNV2': None}
+        self.ion_gauge = next(iter(self.gauges))
+        self.filament = 1  # lit filament, 0 for emission off
+
+    def __pressure(self, label: str) -> str:
+        pressure = self.gauges[label]
+        if pressure is None:
+            return 'NOCBL'
+        if label == self.ion_gauge and not self.filament:
+            return 'OFF'
+        return f'{self.jitter(pressure):.3E}'
+
+    def respond(self, request: bytes) -> bytes:
+        cmd, label = request[:5].decode(), request[6:].decode()
+        if cmd == '#000F':
+            res = ','.join(self.__pressure(label) for label in self.gauges)
+        elif label not in self.gauges:
+            res = None
+        elif cmd == '#0002':
+            res = self.__pressure(label)
+        elif cmd == '#0032':
+            res = '01' if self.filament else '00'
+        elif cmd == '#0034':
+            res = f'{self.filament:02d}'
+        elif cmd in ('#0030', '#0031', '#0033'):
+            self.filament = {'#0030': 0, '#0031': 1, '#0033': 2}[cmd]
+            res = ''
+        else:
+            res = None
+        return b'?FF\r' if res is None else f'>{res}\r'.encode()
+
+
+class TC290Simulator(LineSimulator):
+    """
+    SCPI-like commands of the TC290, '\\r\\n' framed. Queries reply, set commands do not.
+    """
+    terminator = b'\n'
+
+    def __init__(self, latency: float = 0.005, noise: float = 0.001, seed: int = None) -> None:
+        super().__init__(latency, noise, seed)
+        self.kelvin = [4.2, 3.5, 50., 300., 0., 0., 0., 0., 0., 0.]
+        self.state = {ch: {'SETP': '4.200', 'OUTMODE': '1,1,0', 'RANGE': '2', 'PID': '50,20,0',
+                           'HTRSET': '0,1,2,0.000,1', 'HTR': 12.5} for ch in ('1', '2')}
+
+    def respond(self, request: bytes) -> bytes:
+        cmd, _, args = request.decode().partition(' ')
+        if cmd == '*IDN?':
+            return b'SIM,TC290,000000,1.0\r\n'
+        if cmd == 'KRDG?':
+            return (','.join(f'{self.jitter(t):.4f}' for t in self.kelvin) + '\r\n').encode()
+        if cmd.endswith('?') and args in self.state:
+            val = self.state[args][cmd[:-1]]
+            return (f'{self.jitter(val):.2f}' if cmd == 'HTR?' else val).encode() + b'\r\n'
+        ch, _, val = args.partition(',')
+        if cmd in ('SETP', 'OUTMODE', 'RANGE', 'PID', 'HTRSET') and ch in self.state:
+            self.state[ch][cmd] = val
+        return None
+
+
+class Model336Simulator(LineSimulator):
+    """
+    The queries of lakeshore.Model336 used by the monitors, commands end with '\\n' and
+    replies with '\\r\\n' (TCP port 7777 on the real controller). The client checks errors
+    with compound '...;*ESR?' commands, answered with ';' joined replies.
+    """
+    terminator = b'\n'
+
+    def __init__(self, latency: float = 0.005, noise: float = 0.001, seed: int = None) -> None:
+        super().__init__(latency, noise, seed)
+        self.kelvin = [4.2, 3.5, 50., 1.5, 1.6, 1.7, 0., 0.]
+        self.state = {ch: {'SETP': '+4.2000', 'OUTMODE': '1,1,0', 'RANGE': '2', 'PID': '+50.0,+20.0,+0',
+                           'HTRSET': '1,1,+0.000,1', 'HTR': 12.5} for ch in ('1', '2')}
+
+    def __respond(self, request: str) -> str:
+        cmd, _, args = request.strip().partition(' ')
+        if cmd == '*IDN?':
+            return 'LSCI,MODEL336,SIM0001/SIM0001,2.9'
+        if cmd == '*ESR?':
+            return '0'
+        if cmd == 'KRDG?':
+            return ','.join(f'{self.jitter(t):+.4f}' for t in self.kelvin)
+        if cmd.endswith('?') and args in self.state:
+            val = self.state[args][cmd[:-1]]
+            return f'{self.jitter(val):+.2f}' if cmd == 'HTR?' else val
+        ch, _, val = args.partition(',')
+        if cmd in ('SETP', 'OUTMODE', 'RANGE', 'PID', 'HTRSET') and ch in self.state:
+            self.state[ch][cmd] = val
+        return None
+
+    def respond(self, request: bytes) -> bytes:  # 'KRDG? 0;*ESR?' -> '...;0', no reply for set commands only
+        replies = [res for cmd in request.decode().split(';') if (res := self.__respond(cmd)) is not None]
+        return (';'.join(replies) + '\r\n').encode() if replies else None
+
+
+class DeepVNASimulator(LineSimulator):
+    """
+    NanoVNA shell of the DeepVNA: echo, reply lines and the 'ch> ' prompt. The trace is a
+    notch at f0 + drift * t of depth (linear) and linewidth (Hz) with complex noise, a sweep
+    takes point_time per point. binary=False answers 'scan' with usage text like firmware
+    without it, None also has no single-shot scan at all.
+    """
+    terminator = b'\r'
+
+    def __init__(self, f0: float = 41.96e6, linewidth: float = 40e3, depth: float = 0.9, drift: float = 0.,
+                 point_time: float = 1e-4, binary: bool = True, latency: float = 0.001, noise: float = 0.005,
+                 seed: int = None) -> None:
+        super().__init__(latency, noise, seed)
+        self.f0, self.linewidth, self.depth, self.drift = f0, linewidth, depth, drift
+        self.point_time = point_time
+        self.binary = binary
+        self.sweep = (f0 - 1e6, f0 + 1e6, 101)
+        self.__t0 = time.monotonic()
+        self.__data = None
+
+    def trace(self, frq: np.ndarray) -> np.ndarray:
+        f0 = self.f0 + self.drift * (time.monotonic() - self.__t0)
+        noise = self.noise * (self.rng.standard_normal(len(frq)) + 1j * self.rng.standard_normal(len(frq)))
+        return 1 - self.depth / (1 + 2j * (frq - f0) / self.linewidth) + noise
+
+    def __measure(self, start: float, stop: float, points: int) -> np.ndarray:
+        self.sweep = (start, stop, points)
+        time.sleep(points * self.point_time)
+        frq = np.linspace(start, stop, points).round()
+        self.__data = self.trace(frq)
+        return frq
+
+    def respond(self, request: bytes) -> bytes:
+        cmd, *args = request.decode().split()
+        out = b''
+        if cmd == 'sweep' and len(args) >= 2:
+            self.sweep = (float(args[0]), float(args[1]), int(args[2]) if len(args) > 2 else self.sweep[2])
+        elif cmd == 'pause' and self.__data is None:
+            self.__measure(*self.sweep)
+        elif cmd == 'frequencies':
+            out = ''.join(f'{x:.0f}\r\n' for x in np.linspace(*self.sweep[:2], self.sweep[2]).round()).encode()
+        elif cmd == 'data' and args == ['0']:
+            data = self.trace(np.linspace(*self.sweep[:2], self.sweep[2])) if self.__data is None else self.__data
+            out = ''.join(f'{x.real:.9f} {x.imag:.9f}\r\n' for x in data).encode()
+        elif cmd == 'resume':
+            self.__data = None
+        elif cmd == 'scan' and self.binary is not None and (len(args) == 3 or self.binary and len(args) == 4):
+            frq = self.__measure(float(args[0]), float(args[1]), int(args[2]))
+            mask = int(args[3], 0) if len(args) == 4 else 0
+            if mask:
+                trace = np.zeros(len(frq), np.dtype([('frequency', '<u4'), ('data0', '<f4', 2)]))
+                trace['frequency'] = frq
+                trace['data0'] = np.stack([self.__data.real, self.__data.imag], 1)
+                out = struct.pack('<HH', mask, len(frq)) + trace.tobytes()
+        elif cmd == 'scan':
+            out = b'usage: scan {start(Hz)} {stop(Hz)} [points]\r\n'
+        return request + b'\r\n' + out + b'ch> '
+
+
+class DL7Simulator:
+    """
+    Streams 'N.N  E - N Pa\\r' frames of pressure (Pa) at rate frames/s to every TCP client,
+    starting mid-frame like the real gauge. latency delays the first frame.
+    """
+
+    def __init__(self, pressure: float = 1.2e-5, rate: float = 10, latency: float = 0., noise: float = 0.01,
+                 seed: int = None) -> None:
+        self.pressure = pressure
+        self.rate = rate
+        self.latency = latency
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.frames = 0
+        self.__stop = threading.Event()
+        self.__server = None
+        self.__thread = None
+
+    def frame(self) -> bytes:
+        pressure = self.pressure * (1 + self.noise * self.rng.standard_normal())
+        mantissa, exponent = f'{pressure:.1E}'.split('E')
+        return f'{mantissa}  E {"-" if int(exponent) < 0 else "+"} {abs(int(exponent))} Pa\r'.encode()
+
+    def serve_tcp(self, port: int = 8234, host: str = '127.0.0.1') -> int:
+        self.__server = socket.create_server((host, port))
+        self.__thread = threading.Thread(target=self.__accept, daemon=True)
+        self.__thread.start()
+        return self.__server.getsockname()[1]
+
+    def __accept(self) -> None:
+        while not self.__stop.is_set():
+            try:
+                conn, _ = self.__server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self.__stream, args=(conn,), daemon=True).start()
+
+    def __stream(self, conn: socket.socket) -> None:
+        with conn:
+            time.sleep(self.latency)
+            t_next = time.monotonic()
+            try:
+                conn.sendall(self.frame()[5:])  # joined mid-frame
+                while not self.__stop.is_set():
+                    t_next += 1 / self.rate
+                    self.__stop.wait(max(0., t_next - time.monotonic()))
+                    conn.sendall(self.frame())
+                    self.frames += 1
+            except OSError:
+                return
+
+    def stop(self) -> None:
+        self.__stop.set()
+        if self.__server:
+            shutdown(self.__server)
+            self.__thread.join()
+
+
+class LatencyProxy:
+    """
+    Forwards TCP connections from a local port to (host, target_port), holding every request
+    for latency seconds, for servers that cannot delay their own replies (snap7).
+    """
+
+    def __init__(self, target_port: int, latency: float, host: str = '127.0.0.1') -> None:
+        self.target = (host, target_port)
+        self.latency = latency
+        self.__server = None
+        self.__thread = None
+
+    def serve_tcp(self, port: int = 0, host: str = '127.0.0.1') -> int:
+        self.__server = socket.create_server((host, port))
+        self.__thread = threading.Thread(target=self.__accept, daemon=True)
+        self.__thread.start()
+        return self.__server.getsockname()[1]
+
+    def __accept(self) -> None:
+        while True:
+            try:
+                client, _ = self.__server.accept()
+                upstream = socket.create_connection(self.target)
+            except OSError:
+                return
+            threading.Thread(target=self.__pump, args=(client, upstream, self.latency), daemon=True).start()
+            threading.Thread(target=self.__pump, args=(upstream, client, 0.), daemon=True).start()
+
+    @staticmethod
+    def __pump(src: socket.socket, dst: socket.socket, latency: float) -> None:
+        try:
+            while recv := src.recv(4096):
+                time.sleep(latency)
+                dst.sendall(recv)
+        except OSError:
+            pass
+        for s in (src, dst):
+            s.close()
+
+    def stop(self) -> None:
+        if self.__server:
+            shutdown(self.__server)
+            self.__thread.join()
+
+
+class PLCSimulator:
+    """
+    snap7 server holding the M and PA areas of a PLC described by a RegisterMap, e.g.
+    lib.helium_stabilizer.REGISTERS or lib.plc.REGISTERS. values gives the initial register
+    values, the float registers in noisy get new noise every update_interval seconds. Writes of
+    the clients (set_*) land in the same memory. Connect with tcp_port = the returned port.
+    """
+
+    def __init__(self, registers, values: dict, noisy: list = (), update_interval: float = 0.5,
+                 latency: float = 0., noise: float = 0.001, seed: int = None) -> None:
+        self.registers = registers
+        self.values = dict(values)
+        self.noisy = list(noisy)
+        self.update_interval = update_interval
+        self.latency = latency
+        self.noise = noise
+        self.rng = np.random.default_rng(seed)
+        self.__areas = {}  # area name -> ctypes buffer
+        self.__server = None
+        self.__proxy = None
+        self.__stop = threading.Event()
+
+    def __write(self, name: str, val) -> None:
+        r = self.registers.registers[name]
+        buffer = self.__areas[r.area.name]
+        size = struct.calcsize(f'>{r.fmt}')
+        if r.bit is not None:
+            byte = buffer[r.offset] & ~(1 << r.bit) | (int(val) & 1) << r.bit
+            buffer[r.offset] = byte & 0xff
+        else:
+            ctypes.memmove(ctypes.addressof(buffer) + r.offset, struct.pack(f'>{r.fmt}', val), size)
+
+    def __update(self) -> None:
+        while not self.__stop.wait(self.update_interval):
+            for name in self.noisy:
+                self.__write(name, self.values[name] * (1 + self.noise * self.rng.standard_normal()))
+
+    def serve_tcp(self, port: int = 1102) -> int:  # 102 of a real PLC needs root, 0 for a free port
+        port = port or free_port()
+        import snap7
+        try:
+            from snap7.type import SrvArea
+            server_areas = {'MK': SrvArea.MK, 'PA': SrvArea.PA}
+        except ImportError:  # python-snap7 < 2
+            from snap7.types import srvAreaMK, srvAreaPA
+            server_areas = {'MK': srvAreaMK, 'PA': srvAreaPA}
+        self.__server = snap7.server.Server(log=False)
+        for area in {r.area.name for r in self.registers.registers.values()}:
+            self.__areas[area] = (ctypes.c_uint8 * 256)()
+            self.__server.register_area(server_areas[area], 0, self.__areas[area])
+        for name, val in self.values.items():
+            self.__write(name, val)
+        if self.latency:
+            server_port = free_port()
+            self.__proxy = LatencyProxy(server_port, self.latency)
+            self.__server.start(server_port)
+            self.__proxy.serve_tcp(port)
+        else:
+            self.__server.start(port)
+        threading.Thread(target=self.__update, daemon=True).start()
+        return port
+
+    def stop(self) -> None:
+        self.__stop.set()
+        if self.__proxy:
+            self.__proxy.stop()
+        if self.__server:
+            self.__server.stop()
+            self.__server.destroy()
+
+
+def helium_stabilizer_simulator(**kwargs) -> PLCSimulator:
+    from lib.helium_stabilizer import REGISTERS
+    return PLCSimulator(REGISTERS, {
+        'sv1': 1, 'sv2': 0, 'manual_or_auto': 5, 'pressure_1': 1.04,
+        'setpoint_a': 1.03, 'setpoint_b': 1.04, 'setpoint_c': 1.05, 'compare_period': 1000
+    }, noisy=['pressure_1'], **kwargs)
+
+
+def plc_simulator(**kwargs) -> PLCSimulator:
+    from lib.plc import REGISTERS
+    return PLCSimulator(REGISTERS, {
+        'sv1': 1, 'sv2': 0, 'manual_or_auto': 1, 'p01': 1.04,
+        'setpoint_a': 1.03, 'setpoint_b': 1.04, 'setpoint_c': 1.05, 'setpoint_d': 1.06, 't1': 4.2
+    }, noisy=['p01', 't1'], **kwargs)
+
+
+if __name__ == '__main__':  # every stand-in on localhost at the ports of the drivers
+    logging.basicConfig(level=logging.INFO)
+    simulators = [DL7Simulator(), XGS600Simulator(), Model336Simulator(), TC290Simulator(), DeepVNASimulator()]
+    print('DL7', simulators[0].serve_tcp(8234))
+    print('XGS600 tcp', simulators[1].serve_tcp(4001), 'serial', simulators[1].serve_pty())
+    print('Model336', simulators[2].serve_tcp(7777))
+    print('TC290 serial', simulators[3].serve_pty())
+    print('DeepVNA serial', simulators[4].serve_pty())
+    try:
+        simulators.append(helium_stabilizer_simulator())
+        print('HeliumStabilizer snap7', simulators[-1].serve_tcp(1102))
+    except ImportError:
+        logging.warning('no python-snap7, no PLC simulator')
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        for simulator in simulators:
+            simulator.stop()
@@ -0,0 +1,84 @@
+import logging
+import threading
+
+
+class Supervisor:
+    """
+    Keeps one Device connected. A query failing with one of device.connection_errors, or
+    `failures` queries failing in a row, takes the device down: it is closed and reopened by a
+    background thread with exponential backoff (min_backoff doubling up to max_backoff seconds),
+    so connect() re-resolves serial ports by serial number. While the device is down query()
+    returns None at once instead of touching the link.
+    """
+
+    def __init__(self, device, min_backoff: float = 1., max_backoff: float = 60., failures: int = 3) -> None:
+        self.device = device
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.max_failures = failures
+        self.up = False
+        self.failures = 0  # failed queries
+        self.reconnects = 0  # successful reopens
+        self.__failures_in_row = 0
+        self.__stop = threading.Event()
+        self.__thread = None
+
+    def start(self) -> None:  # first connect in the caller, then in the background if it failed
+        try:
+            self.device.open()
+            self.up = True
+        except Exception:
+            logging.exception(f'{self.device.name}, Connect Failed')
+            self.__down()
+
+    def query(self) -> list:
+        if not self.up:
+            return None
+        try:
+            row = self.device.query()
+        except Exception as e:
+            self.failures += 1
+            self.__failures_in_row += 1
+            if isinstance(e, self.device.connection_errors) or self.__failures_in_row >= self.max_failures:
+                self.__down()
+            raise
+        self.__failures_in_row = 0
+        return row
+
+    def __close(self) -> None:
+        try:
+            self.device.close()
+        except Exception:
+            pass
+
+    def __down(self) -> None:
+        self.up = False
+        self.__failures_in_row = 0
+        logging.warning(f'{self.device.name}, Down')
+        self.__thread = threading.Thread(target=self.__reconnect, name=f'{self.device.name} reconnect', daemon=True)
+        self.__thread.start()
+
+    def __reconnect(self) -> None:
+        self.__close()  # here, closing a dead link may block until its timeout
+        backoff = self.min_backoff
+        while not self.__stop.wait(backoff):
+            try:
+                self.device.open()
+                self.device.check()
+            except Exception as e:
+                self.__close()
+                backoff = min(backoff * 2, self.max_backoff)
+                logging.warning(f'{self.device.name}, Reconnect Failed ({e!r}), retry in {backoff} s')
+                continue
+            self.reconnects += 1
+            self.up = True
+            logging.info(f'{self.device.name}, Reconnected')
+            return
+
+    def close(self) -> None:
+        self.__stop.set()
+        if self.__thread:
+            self.__thread.join()
+        if self.up:
+            self.up = False
+            self.device.close()
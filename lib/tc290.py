@@ -2,6 +2,8 @@ import time
 import serial
 import serial.tools.list_ports
 
+from lib.transport import SerialTransport
+
 
 def find_com_name(serial_number:str) -> str:
     comports_dict = {comport.name:comport.serial_number for comport in serial.tools.list_ports.comports()}
@@ -9,7 +11,7 @@ def find_com_name(serial_number:str) -> str:
     if names:
         return names[0]
     else:
-        raise
+        raise serial.SerialException(f'no serial port with serial number {serial_number}')
 
 
 class TC290:
@@ -29,22 +31,42 @@ class TC290:
     maximum_custom_setting_current
     display_mode: 1-2 corresponds to Current|Power
     """
-    def __init__(self, serial_number:str=None, com:str=None, baudrate=115200) -> None:
+    def __init__(self, serial_number:str=None, com:str=None, baudrate=115200, timeout:float=0.5) -> None:
         if serial_number:
             port = find_com_name(serial_number)
         elif com:
             port = com
         else:
             raise
-        self.__ser = serial.Serial(port=port, baudrate=baudrate)
-        self.__ser.timeout = 0.5
+        self.__transport = SerialTransport(port, baudrate, b'\n', timeout)
         
     def close(self) -> None:
-        self.__ser.close()
+        self.__transport.close()
         
     def query(self, cmd:str) -> str:
-        self.__ser.write(f'{cmd}\r\n'.encode())
-        return self.__ser.readline().decode().strip()
+        return self.__transport.query(f'{cmd}\r\n'.encode()).decode().strip()
+
+    def query_many(self, cmds:list[str]) -> list[str]:
+        # written back-to-back, the replies in order under a deadline of timeout per command, commands must reply
+        return [x.decode().strip() for x in self.__transport.query_many([f'{cmd}\r\n'.encode() for cmd in cmds])]
+
+    def command(self, cmd:str) -> None:  # set commands, a reply is optional
+        self.__transport.resync()
+        self.__transport.write(f'{cmd}\r\n'.encode())
+        try:
+            self.__transport.read_frame()
+        except TimeoutError:
+            pass
+    
+    def query_status(self) -> list[str]:  # KRDG? and the state of both outputs in one batch
+        cmds = ['KRDG?'] + [f'{x} {ch}' for ch in [1, 2] for x in ['SETP?', 'OUTMODE?', 'RANGE?', 'PID?', 'HTR?', 'HTRSET?']]
+        replies = self.query_many(cmds)
+        status = replies[0].split(',')
+        for ch in [0, 1]:
+            set_value, output_parameters, output_range, pid, percentage, heating_output_parameters = replies[1+6*ch:7+6*ch]
+            status += [set_value] + output_parameters.split(',') + [output_range] + pid.split(',')
+            status += [percentage] + heating_output_parameters.split(',')
+        return status
     
     def query_idn(self) -> str:
         return self.query('*IDN?')
@@ -58,21 +80,21 @@ class TC290:
         return mode, input_channel, start_at_boot
     
     def configure_output_parameters(self, output_channel:int, mode:int, input_channel:int, start_at_boot:int) -> None:
-        self.query(f'OUTMODE {output_channel},{mode},{input_channel},{start_at_boot}')
+        self.command(f'OUTMODE {output_channel},{mode},{input_channel},{start_at_boot}')
         
     def query_output_range(self, output_channel:int) -> str:
         output_range  = self.query(f'RANGE? {output_channel}')
         return output_range
     
     def configure_output_range(self, output_channel:int, output_range:int) -> None:
-        self.query(f'RANGE {output_channel},{output_range}')
+        self.command(f'RANGE {output_channel},{output_range}')
         
     def query_temperature_control_pid_parameters(self, output_channel:int) -> [str]: # type: ignore
         P, I, D  = self.query(f'PID? {output_channel}').split(',')
         return P, I, D
     
     def configure_temperature_control_pid_parameters(self, output_channel:int, P:int, I:int, D:int) -> None:
-        self.query(f'PID {output_channel},{P},{I},{D}')
+        self.command(f'PID {output_channel},{P},{I},{D}')
 
     def query_heating_output(self, temperature_control_channel:int) -> str:
         percentage  = self.query(f'HTR? {temperature_control_channel}')
@@ -83,14 +105,14 @@ class TC290:
         return ch2_output_mode, heating_resistance_value, maximum_current, maximum_custom_setting_current, display_mode
     
     def configure_heating_output_parameters(self, temperature_control_channel:int, ch2_output_mode:int, heating_resistance_value:int, maximum_current:int, maximum_custom_setting_current:int, display_mode:int) -> None:
-        self.query(f'HTRSET {temperature_control_channel},{ch2_output_mode},{heating_resistance_value},{maximum_current},{maximum_custom_setting_current},{display_mode}')
+        self.command(f'HTRSET {temperature_control_channel},{ch2_output_mode},{heating_resistance_value},{maximum_current},{maximum_custom_setting_current},{display_mode}')
         
     def query_control_loop_setpoint(self, output_channel:int) -> str:
         set_value = self.query(f'SETP? {output_channel}')
         return set_value
     
     def set_control_loop_setpoint(self, output_channel:int, set_value:int) -> None:
-        self.query(f'SETP {output_channel},{set_value}')
+        self.command(f'SETP {output_channel},{set_value}')
 
 
 if __name__ == '__main__':
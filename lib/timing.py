@@ -0,0 +1,149 @@
+import time
+import logging
+import threading
+import functools
+from collections import defaultdict, deque
+import numpy as np
+
+
+# Per-stage timing of the acquisition loops, off unless enable() was called. Disabled, stage() hands
+# out one shared do-nothing context manager and timed() adds a flag check to the call.
+#
+#   timer = timing.timer('DeepVNA')
+#   with timer.stage('analysis'):
+#       ...
+#   timing.enable(); timing.start_reporting(600)  # summary of every timer to the log every 600 s
+
+
+enabled = False
+timers = {}  # device name -> StageTimer
+HISTOGRAM_BINS = 2. ** np.arange(10, 36)  # ns, 1 us .. 34 s in powers of 2
+
+
+class _NullStage:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    __slots__ = ('timer', 'name', 't0')
+
+    def __init__(self, timer, name: str) -> None:
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.timer.record(self.name, time.perf_counter_ns() - self.t0)
+
+
+class StageTimer:
+    """
+    Rolling durations (ns) of the stages of one device, the last window of each stage. A stage
+    failing with an exception is recorded too, its time was spent all the same.
+    """
+
+    def __init__(self, name: str, window: int = 1000) -> None:
+        self.name = name
+        self.window = window
+        self.__durations = defaultdict(lambda: deque(maxlen=self.window))
+        self.__lock = threading.Lock()
+
+    def stage(self, name: str):
+        return _Stage(self, name) if enabled else NULL_STAGE
+
+    def timed(self, name: str):  # decorator, like wrapping the whole call in stage(name)
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not enabled:
+                    return func(*args, **kwargs)
+                t0 = time.perf_counter_ns()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter_ns() - t0)
+            return wrapper
+        return decorator
+
+    def record(self, name: str, ns: int) -> None:
+        with self.__lock:
+            self.__durations[name].append(ns)
+
+    def durations(self, name: str) -> np.ndarray:  # in ns
+        with self.__lock:
+            return np.array(self.__durations.get(name, ()), np.int64)
+
+    def histogram(self, name: str) -> np.ndarray:  # counts of the window in HISTOGRAM_BINS, first is < 1 us
+        return np.bincount(np.searchsorted(HISTOGRAM_BINS, self.durations(name), side='right'),
+                           minlength=len(HISTOGRAM_BINS) + 1)
+
+    def summary(self) -> dict:  # stage -> n, mean, p50, p99 and max in ms
+        summary = {}
+        with self.__lock:
+            names = list(self.__durations)
+        for name in names:
+            x = self.durations(name)
+            if len(x):
+                p50, p99 = np.percentile(x, [50, 99]) * 1e-6
+                summary[name] = {'n': len(x), 'mean': float(x.mean()) * 1e-6, 'p50': float(p50),
+                                 'p99': float(p99), 'max': float(x.max()) * 1e-6}
+        return summary
+
+    def clear(self) -> None:
+        with self.__lock:
+            self.__durations.clear()
+
+
+def timer(name: str) -> StageTimer:  # one StageTimer per device name
+    if name not in timers:
+        timers[name] = StageTimer(name)
+    return timers[name]
+
+
+def enable(on: bool = True) -> None:
+    global enabled
+    enabled = on
+
+
+def log_summary() -> None:
+    for name, t in list(timers.items()):
+        if summary := t.summary():
+            logging.info(f'{name}, Timing (ms) ' + ', '.join(
+                f'{stage} p50 {x["p50"]:.3f} p99 {x["p99"]:.3f} max {x["max"]:.3f} n {x["n"]}'
+                for stage, x in summary.items()))
+
+
+_reporter = None
+
+
+def start_reporting(interval: float = 600.) -> None:  # log_summary every interval seconds until stop_reporting
+    global _reporter
+    stop = threading.Event()
+
+    def report():
+        while not stop.wait(interval):
+            log_summary()
+
+    _reporter = (threading.Thread(target=report, name='timing report', daemon=True), stop)
+    _reporter[0].start()
+
+
+def stop_reporting() -> None:  # with a last summary
+    global _reporter
+    if _reporter:
+        _reporter[1].set()
+        _reporter[0].join()
+        _reporter = None
+        log_summary()
@@ -0,0 +1,131 @@
+import time
+import socket
+import serial
+
+
+class Transport:
+    """
+    Byte stream to an instrument framed by a terminator. read_frame() blocks until a whole
+    frame arrived or the deadline passed, bytes after the frame are kept for the next one.
+    A request first drops pending input, after a timeout also the replies still owed (waiting up
+    to timeout for each), so a late reply is never taken for the one of the next request.
+    """
+
+    def __init__(self, terminator: bytes = b'\r', timeout: float = 0.5) -> None:
+        self.terminator = terminator
+        self.timeout = timeout
+        self.__rx = bytearray()
+        self.__owed = 0  # replies of timed out requests
+
+    def write(self, data: bytes) -> None:
+        raise NotImplementedError
+
+    def _read(self, timeout: float) -> bytes:  # whatever arrived within timeout, b'' if nothing
+        raise NotImplementedError
+
+    def close(self) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:  # drops what was received and what is pending
+        self.__rx.clear()
+
+    def resync(self) -> None:  # before a request
+        if self.__owed:
+            deadline = time.perf_counter() + self.timeout * self.__owed
+            try:
+                for _ in range(self.__owed):
+                    self.read_frame(deadline)
+            except TimeoutError:
+                pass
+            self.__owed = 0
+        self.clear()
+
+    def read_frame(self, deadline: float = None) -> bytes:  # with the terminator, deadline in time.perf_counter()
+        deadline = deadline or time.perf_counter() + self.timeout
+        start = 0
+        while (i := self.__rx.find(self.terminator, start)) < 0:
+            start = max(0, len(self.__rx) - len(self.terminator) + 1)
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                raise TimeoutError(f'{self}, no {self.terminator} in {self.timeout} s')
+            self.__rx += self._read(remaining)
+        frame = bytes(self.__rx[:i + len(self.terminator)])
+        del self.__rx[:i + len(self.terminator)]
+        return frame
+
+    def query(self, data: bytes) -> bytes:
+        return self.query_many([data])[0]
+
+    def query_many(self, data: list[bytes]) -> list[bytes]:  # written back-to-back, one deadline for all frames
+        self.resync()
+        self.write(b''.join(data))
+        deadline = time.perf_counter() + self.timeout * len(data)
+        frames = []
+        try:
+            for _ in data:
+                frames.append(self.read_frame(deadline))
+        except TimeoutError:
+            self.__owed = len(data) - len(frames)
+            raise
+        return frames
+
+
+class SerialTransport(Transport):
+
+    def __init__(self, port: str, baudrate: int = 9600, terminator: bytes = b'\r', timeout: float = 0.5) -> None:
+        super().__init__(terminator, timeout)
+        self.__ser = serial.Serial(port=port, baudrate=baudrate)
+
+    def __str__(self) -> str:
+        return self.__ser.port
+
+    def write(self, data: bytes) -> None:
+        self.__ser.write(data)
+
+    def _read(self, timeout: float) -> bytes:
+        self.__ser.timeout = timeout
+        return self.__ser.read(max(1, self.__ser.in_waiting))
+
+    def clear(self) -> None:
+        super().clear()
+        self.__ser.reset_input_buffer()
+
+    def close(self) -> None:
+        self.__ser.close()
+
+
+class SocketTransport(Transport):
+
+    def __init__(self, ip: str, port: int, terminator: bytes = b'\r', timeout: float = 0.5) -> None:
+        super().__init__(terminator, timeout)
+        self.__address = (ip, port)
+        self.__sock = socket.create_connection(self.__address, timeout)
+        self.__sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)  # short requests, do not wait for acks
+
+    def __str__(self) -> str:
+        return f'{self.__address[0]}:{self.__address[1]}'
+
+    def write(self, data: bytes) -> None:
+        self.__sock.sendall(data)
+
+    def _read(self, timeout: float) -> bytes:
+        self.__sock.settimeout(timeout)
+        try:
+            recv = self.__sock.recv(4096)
+        except socket.timeout:
+            return b''
+        if not recv:
+            raise ConnectionError(f'{self}, closed by the instrument')
+        return recv
+
+    def clear(self) -> None:
+        super().clear()
+        self.__sock.setblocking(False)  # _read sets the timeout again
+        try:
+            while self.__sock.recv(4096):
+                pass
+        except BlockingIOError:
+            pass
+
+    def close(self) -> None:
+        self.__sock.close()
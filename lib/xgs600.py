@@ -1,7 +1,12 @@
 import re
-import serial
+import numpy as np
 import serial.tools.list_ports
 
+from lib.transport import SerialTransport, SocketTransport
+
+
+RESPONSE = re.compile(rb'>([^\r]*)\r')
+
 
 def find_com_name(serial_number:str) -> str:
     comports_dict = {comport.name:comport.serial_number for comport in serial.tools.list_ports.comports()}
@@ -9,48 +14,133 @@ def find_com_name(serial_number:str) -> str:
     if names:
         return names[0]
     else:
-        raise
+        raise serial.SerialException(f'no serial port with serial number {serial_number}')
+
+
+def parse_response(frame:bytes) -> str:  # '>1.000E-08\r' -> '1.000E-08', '' for an error reply such as '?FF\r'
+    res = RESPONSE.search(frame)
+    return res[1].decode().strip() if res else ''
+
+
+def parse_pressure(res:str) -> float:  # nan for OFF (emission off), NOCBL, an error reply, etc.
+    try:
+        return float(res)
+    except ValueError:
+        return np.nan
+
+
+def parse_pressures(res:str) -> np.ndarray:  # comma separated
+    return np.array([parse_pressure(x) for x in res.split(',')])
+
+
+class XGS600Protocol:
+    """
+    Commands and replies of the XGS600 without I/O, shared by XGS600 and lib/aio.AsyncXGS600.
+    A request is (commands, parse): the commands are written in one batch and parse() turns
+    their replies, in order, into the result. gauges are the labels of the readings of
+    #000F (read all pressures) in controller order, ion_gauge is the label of the hot filament gauge.
+    """
+
+    def __init__(self, gauges:list[str]=None, ion_gauge:str='HFIG1') -> None:
+        self.gauges = gauges
+        self.ion_gauge = ion_gauge
+
+    @staticmethod
+    def encode(cmds:list[str]) -> list[bytes]:
+        return [f'{cmd}\r'.encode() for cmd in cmds]
+
+    @staticmethod
+    def decode(frames:list[bytes]) -> list[str]:
+        return [parse_response(x) for x in frames]
+
+    def labels(self, n:int) -> list[str]:
+        return list(self.gauges or [])[:n] + [f'G{i + 1}' for i in range(len(self.gauges or []), n)]
+
+    def emission_status_request(self) -> tuple:
+        return [f'#0032U{self.ion_gauge}'], lambda res: 1 if res[0] == '01' else 0
+
+    def filament_request(self) -> tuple:  # filament lit, 1|2, 0 if unknown
+        return [f'#0034U{self.ion_gauge}'], lambda res: int(res[0]) if res[0].isdigit() else 0
+
+    def pressure_request(self) -> tuple:
+        return [f'#0002U{self.ion_gauge}'], lambda res: res[0]
+
+    def all_pressures_request(self) -> tuple:  # every gauge in one command, see labels()
+        return ['#000F'], lambda res: parse_pressures(res[0])
 
+    def all_request(self) -> tuple:  # every pressure with the emission and filament of the ion gauge
+        requests = [self.all_pressures_request(), self.emission_status_request(), self.filament_request()]
 
-class XGS600:
-    
-    def __init__(self, serial_number:str=None, com:str=None, baudrate=9600) -> None:
-        if serial_number:
-            port = find_com_name(serial_number)
+        def parse(res:list[str]) -> dict:
+            pressures, emission, filament = [parse_one([x]) for (_, parse_one), x in zip(requests, res)]
+            return {'labels': self.labels(len(pressures)), 'pressures': pressures, 'emission': emission,
+                    'filament': filament}
+
+        return [cmd for cmds, _ in requests for cmd in cmds], parse
+
+    def command_request(self, code:str) -> tuple:  # '30' emission off, '31'|'33' filament 1|2 emission on
+        return [f'#00{code}U{self.ion_gauge}'], lambda res: None
+
+
+class XGS600(XGS600Protocol):
+    """
+    XGS600Protocol over a serial port (serial_number or com) or the TCP serial server of the
+    controller (ip, port).
+    """
+
+    def __init__(self, serial_number:str=None, com:str=None, baudrate=9600, ip:str=None, port:int=4001,
+                 gauges:list[str]=None, ion_gauge:str='HFIG1', timeout:float=0.5) -> None:
+        super().__init__(gauges, ion_gauge)
+        if ip:
+            self.__transport = SocketTransport(ip, port, b'\r', timeout)
+        elif serial_number:
+            self.__transport = SerialTransport(find_com_name(serial_number), baudrate, b'\r', timeout)
         elif com:
-            port = com
+            self.__transport = SerialTransport(com, baudrate, b'\r', timeout)
         else:
             raise
-        self.__ser = serial.Serial(port=port, baudrate=baudrate)
-        self.__ser.timeout = 0.5
 
     def close(self) -> None:
-        self.__ser.close()
-    
+        self.__transport.close()
+
     def query(self, cmd:str) -> str:
-        self.__ser.write(f'{cmd}\r'.encode())
-        recv = self.__ser.readline().decode()
-        res = re.compile(r'>(\S+)\r').findall(recv)
-        return res[0] if res else ''
-        
+        return self.query_many([cmd])[0]
+
+    def query_many(self, cmds:list[str]) -> list[str]:  # pipelined, the replies in order
+        return self.decode(self.__transport.query_many(self.encode(cmds)))
+
+    def request(self, request:tuple):
+        cmds, parse = request
+        return parse(self.query_many(cmds))
+
     def read_emission_status(self) -> int:
-        return 1 if self.query('#0032UHFIG1') == '01' else 0
-        
+        return self.request(self.emission_status_request())
+
+    def read_filament(self) -> int:
+        return self.request(self.filament_request())
+
     def read_pressure(self) -> str:
-        return self.query('#0002UHFIG1')
-        
+        return self.request(self.pressure_request())
+
+    def read_all_pressures(self) -> np.ndarray:
+        return self.request(self.all_pressures_request())
+
+    def read_all(self) -> dict:  # one batch
+        return self.request(self.all_request())
+
     def set_emission_off(self) -> None:
-        self.query('#0030UHFIG1')
-        
+        self.request(self.command_request('30'))
+
     def set_fil_1_emission_on(self) -> None:
-        self.query('#0031UHFIG1')
-        
+        self.request(self.command_request('31'))
+
     def set_fil_2_emission_on(self) -> None:
-        self.query('#0033UHFIG1')
-    
+        self.request(self.command_request('33'))
+
 
 if __name__ == '__main__':
-    
+
     inst = XGS600(serial_number='AYDPE11BS13')
     print(inst.read_emission_status())
     print(inst.read_pressure())
+    print(inst.read_all())
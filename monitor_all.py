@@ -0,0 +1,39 @@
+import ctypes
+import logging
+
+from lib.daemon import Daemon
+from lib.devices import DL7Device, IonGaugeDevice, HeliumStabilizerDevice, DeepVNADevice, Model336Device
+
+
+task = 'Cryostat'
+plot_interval = 5  # unit is s
+cache_num = 600
+path = '.'
+save_store = True
+print_data = False
+timing_interval = 0  # unit is s, > 0 logs the time of each stage of every cycle to the log
+metrics_port = None  # e.g. 9100, latest values and loop health on http://<this pc>:9100/metrics
+devices = [
+    DL7Device(ip='192.168.30.131', interval=1),
+    IonGaugeDevice(ip='192.168.30.129', interval=1),
+    HeliumStabilizerDevice(ip='192.168.30.130', interval=2, settings={
+        'set_setpoint_a': 1.03, 'set_setpoint_b': 1.04, 'set_setpoint_c': 1.05,
+        'set_compare_period': 1000, 'set_manual_or_auto': 1
+    }),
+    Model336Device(ip='192.168.30.128', interval=1, config_interval=10, verify_interval=60),
+    DeepVNADevice(com='COM3', center=41.96e6, span=2e6, points=301, track=True, sampling_time=2, interval=4),
+]
+
+
+ctypes.WinDLL('winmm').timeBeginPeriod(1)  # ms
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+logging.basicConfig(filename=f'{task}.log',
+                    level=logging.INFO, format=LOG_FORMAT)
+logging.getLogger('apscheduler').setLevel(logging.ERROR)
+logging.getLogger('lakeshore').setLevel(logging.ERROR)
+logging.getLogger('snap7').setLevel(logging.ERROR)
+daemon = Daemon(devices, task, path, cache_num, plot_interval, save_store, print_data, timing_interval,
+                metrics_port)
+daemon.start()
+daemon.plot()
+daemon.stop()
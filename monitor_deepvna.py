@@ -1,13 +1,17 @@
+import time
 import ctypes
 import logging
-import numpy as np
 from datetime import datetime
+from apscheduler.events import EVENT_JOB_ERROR
 from apscheduler.schedulers.background import BackgroundScheduler
 import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 
-from lib.data import recompress, save
-from lib.deepvna import DeepVNA, notch_search
+from lib import timing
+from lib.data import ColumnStore, Writer, recompress
+from lib.live_plot import LivePlot
+from lib.metrics import Metrics
+from lib.ring_buffer import RingBuffer
+from lib.deepvna import DeepVNA, ResonanceTracker, notch_fit
 
 
 inst_port = 'COM3'
@@ -16,11 +20,15 @@ name = 'DeepVNA'
 center = 41.96e6  # unit is Hz
 span = 2e6  # unit is Hz
 points = 301
-sampling_time = 2  # unit is s
+track = True  # re-center and narrow the sweep on the notch, wide (center, span) sweep when it is lost
+sampling_time = 2  # unit is s, sweep time of firmware without a single-shot scan
 interval = 4  # unit is s
 plot_interval = 5  # unit is s
 cache_num = 600
 path = '.'
+save_store = True
+timing_interval = 0  # unit is s, > 0 logs the time of each stage of query() to the log
+metrics_port = None  # e.g. 9100, latest values and loop health on http://<this pc>:9100/metrics
 save_data = True
 save_csv = False
 print_data = True
@@ -33,15 +41,21 @@ columns = [
     'QualityFactor(Unit)', 'Reflect(dB)'
 ]
 timestamp_fmt = '%Y-%m-%d %H:%M:%S.%f'
+timer = timing.timer(name)
+metrics = Metrics(task.lower())
 
 
+@timer.timed('cycle')
 def query():
+    global last_data
+    t0 = time.perf_counter()
     t_now = datetime.now()
-    deepvna.sweep_once(sampling_time)
-    frq = deepvna.frequencies()
-    s11 = [20 * np.log10(np.linalg.norm(x)) for x in deepvna.data0()]
-    center, s11_center, center_left_3db, s11_left_3db, center_right_3db, s11_right_3db, frq_s11_max, s11_max = notch_search(
-        frq, s11)
+    with timer.stage('query'):
+        frq, data = deepvna.acquire(sampling_time)
+    with timer.stage('analysis'):
+        s11 = deepvna.s11_db(data)
+        center, s11_center, center_left_3db, s11_left_3db, center_right_3db, s11_right_3db, frq_s11_max, s11_max = tracker.update(
+            frq, s11) if track else notch_fit(frq, s11)
     quality = center / (center_right_3db - center_left_3db)
     reflect = s11_center - s11_max
 
@@ -52,53 +66,33 @@ def query():
         frq_s11_max, s11_max,
         quality, reflect
     ]
-    data_cache.append(new_data)
-    if len(data_cache) > cache_num:
-        data_cache.pop(0)
-    save(path, task, name, columns, new_data)
-    print(new_data)
+    last_data = new_data
+    data_cache.append(t_now.timestamp(), new_data[1:])
+    with timer.stage('write'):
+        writer.append(new_data)
+    if save_store:
+        with timer.stage('store'):
+            store.append(t_now, new_data[1:])
+    with timer.stage('print'):
+        print(new_data)
+    if metrics_port:
+        metrics.update(name, columns[1:], new_data[1:], t_now.timestamp(), time.perf_counter() - t0)
 
 
 def plot():
-    fig, ax1 = plt.subplots(figsize=(12/2.54, 9/2.54))
-    fig.canvas.manager.set_window_title(name)
     if plot_data:
-        ax2 = ax1.twinx()
-        axs = [ax1, ax2]
-        xlabel = 't(s)'
-        ylabels = ['Quality', 'Reflect(dB)']
-        styles = ['.-', '.-']
-        ax_gap = 55
-
-        colors = list(mcolors.TABLEAU_COLORS)
-        for i in range(len(axs)):
-            axs[i].spines['left'].set_color(colors[0])
-            axs[i].spines['right'].set_color(colors[i])
-            axs[i].tick_params(axis='y', color=colors[i], labelcolor=colors[i])
-            axs[i].spines['right'].set_position(
-                ('outward', ax_gap*(i-1) if i > 1 else 0))
-        plt.ion()
-        while plt.fignum_exists(1):
+        live_plot = LivePlot(name, ['Quality', 'Reflect(dB)'], ['.-', '.-'],
+                             figsize=(12/2.54, 9/2.54))
+        while live_plot.exists():
             if len(data_cache) > 0:
-                x = np.array([datetime.strptime(data[0], timestamp_fmt).timestamp()
-                              for data in data_cache])
-                x -= x[-1]
-                y = [np.array([data[i] for data in data_cache]) for i in [-2, -1]]
-                title = f'{data_cache[-1][0]}\n{float(data_cache[-1][1]) * 1e-6} MHz'
-                for i in range(len(axs)):
-                    axs[i].cla()
-                    axs[i].plot(x, y[i], styles[i],
-                                c=colors[i], label=ylabels[i])
-                    axs[i].ticklabel_format(useOffset=False)
-                    axs[i].spines['right'].set_position(
-                        ('outward', ax_gap*(i-1) if i > 1 else 0))
-                ax1.set_xlabel(xlabel)
-                ax1.set_title(title)
-                fig.legend(loc=2, bbox_to_anchor=(0, 1),
-                           bbox_transform=ax1.transAxes, framealpha=0.1)
-                plt.tight_layout()
-            plt.pause(plot_interval)
+                x = data_cache.times() - data_cache.times()[-1]
+                y = [data_cache[c] for c in ['QualityFactor(Unit)', 'Reflect(dB)']]
+                title = f'{last_data[0]}\n{float(last_data[1]) * 1e-6} MHz'
+                live_plot.update(x, y, title)
+            live_plot.pause(plot_interval)
     else:
+        fig = plt.figure(figsize=(12/2.54, 9/2.54))
+        fig.canvas.manager.set_window_title(name)
         plt.axis('off')
         plt.show()
 
@@ -108,16 +102,36 @@ LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
 logging.basicConfig(filename=f'{task}.log',
                     level=logging.INFO, format=LOG_FORMAT)
 logging.getLogger('apscheduler').setLevel(logging.ERROR)
-data_cache = []
+data_cache = RingBuffer(cache_num, columns[1:])
+last_data = None
+writer = Writer(path, task, name, columns)
+if save_store:
+    store = ColumnStore(path, task, name, columns)
 deepvna = DeepVNA(port=inst_port)
-deepvna.sweep(center, span, points)
+if track:
+    tracker = ResonanceTracker(deepvna, center, span, points)
+else:
+    deepvna.sweep(center, span, points)
 sched = BackgroundScheduler({'apscheduler.timezone': 'Asia/Shanghai'})
 sched.add_job(query, 'interval', seconds=interval, id='query')
+if metrics_port:
+    metrics.serve(metrics_port)
+    sched.add_listener(lambda event: metrics.failure(name), EVENT_JOB_ERROR)
+if timing_interval:
+    timing.enable()
+    timing.start_reporting(timing_interval)
 sched.start()
 logging.info(f'{name}, Start')
 plot()
 sched.shutdown()
+writer.close()
 deepvna.query('resume')
 deepvna.close()
+if save_store:
+    store.close()
+logging.info(f'{name}, sweep duration {deepvna.sweep_stats()}')
+if timing_interval:
+    timing.stop_reporting()
+metrics.close()
 logging.info(f'{name}, Stop')
-recompress(path, task, name)
\ No newline at end of file
+recompress(path, task, name, background='process')
\ No newline at end of file
@@ -1,12 +1,16 @@
+import time
 import ctypes
 import logging
-import numpy as np
 from datetime import datetime
+from apscheduler.events import EVENT_JOB_ERROR
 from apscheduler.schedulers.background import BackgroundScheduler
 import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 
-from lib.data import recompress, save
+from lib import timing
+from lib.data import ColumnStore, Writer, recompress
+from lib.live_plot import LivePlot
+from lib.metrics import Metrics
+from lib.ring_buffer import RingBuffer
 from lib.dl7 import DL7
 
 
@@ -14,65 +18,59 @@ instrument_ip = '192.168.30.131'
 task = 'Cryostat'
 name = 'DL7'
 interval = 1  # unit is s
+all_samples = False  # every frame of the DL7 since the last query with its own time, instead of the latest
 plot_interval = 5  # unit is s
 cache_num = 600
 path = '.'
+save_store = True
+timing_interval = 0  # unit is s, > 0 logs the time of each stage of query() to the log
+metrics_port = None  # e.g. 9100, latest values and loop health on http://<this pc>:9100/metrics
 plot_data = True
 columns = ['Time', 'Pressure(Pa)']
 timestamp_fmt = '%Y-%m-%d %H:%M:%S.%f'
+timer = timing.timer(name)
+metrics = Metrics(task.lower())
 
 
+@timer.timed('cycle')
 def query():
-    t_now = datetime.now()
-    pressure = inst.get_pressure()
-    new_data = [t_now.strftime(timestamp_fmt), pressure]
-    
-    data_cache.append(new_data)
-    if len(data_cache) > cache_num:
-        data_cache.pop(0)
-    save(path, task, name, columns, new_data)
-    print(new_data)
+    global last_data
+    t0 = time.perf_counter()
+    with timer.stage('query'):
+        if all_samples:
+            samples = [(datetime.fromtimestamp(t), pressure) for t, pressure in inst.read_new()]
+        else:
+            samples = [(datetime.now(), inst.get_pressure())]
+    for t_now, pressure in samples:
+        new_data = [t_now.strftime(timestamp_fmt), pressure]
+
+        last_data = new_data
+        data_cache.append(t_now.timestamp(), new_data[1:])
+        with timer.stage('write'):
+            writer.append(new_data)
+        if save_store:
+            with timer.stage('store'):
+                store.append(t_now, new_data[1:])
+        with timer.stage('print'):
+            print(new_data)
+    if metrics_port and samples:
+        metrics.update(name, columns[1:], new_data[1:], t_now.timestamp(), time.perf_counter() - t0)
 
 
 def plot():
-    fig, ax1 = plt.subplots(figsize=(12/2.54, 9/2.54))
-    fig.canvas.manager.set_window_title(name)
     if plot_data:
-        axs = [ax1]
-        xlabel = 't(s)'
-        ylabels = ['Pressure(Pa)']
-        styles = ['.-']
-        ax_gap = 55
-
-        colors = list(mcolors.TABLEAU_COLORS)
-        for i in range(len(axs)):
-            axs[i].spines['left'].set_color(colors[0])
-            axs[i].spines['right'].set_color(colors[i])
-            axs[i].tick_params(axis='y', color=colors[i], labelcolor=colors[i])
-            axs[i].spines['right'].set_position(
-                ('outward', ax_gap*(i-1) if i > 1 else 0))
-        plt.ion()
-        while plt.fignum_exists(1):
+        live_plot = LivePlot(name, ['Pressure(Pa)'], ['.-'],
+                             figsize=(12/2.54, 9/2.54))
+        while live_plot.exists():
             if len(data_cache) > 0:
-                x = np.array([datetime.strptime(data[0], timestamp_fmt).timestamp()
-                              for data in data_cache])
-                x -= x[-1]
-                y = [np.array([float(data[1]) for data in data_cache])]
-                title = f'{data_cache[-1][0]}'
-                for i in range(len(axs)):
-                    axs[i].cla()
-                    axs[i].plot(x, y[i], styles[i],
-                                c=colors[i], label=ylabels[i])
-                    axs[i].ticklabel_format(useOffset=False)
-                    axs[i].spines['right'].set_position(
-                        ('outward', ax_gap*(i-1) if i > 1 else 0))
-                ax1.set_xlabel(xlabel)
-                ax1.set_title(title)
-                fig.legend(loc=2, bbox_to_anchor=(0, 1),
-                           bbox_transform=ax1.transAxes, framealpha=0.1)
-                plt.tight_layout()
-            plt.pause(plot_interval)
+                x = data_cache.times() - data_cache.times()[-1]
+                y = [data_cache['Pressure(Pa)']]
+                title = f'{last_data[0]}'
+                live_plot.update(x, y, title)
+            live_plot.pause(plot_interval)
     else:
+        fig = plt.figure(figsize=(12/2.54, 9/2.54))
+        fig.canvas.manager.set_window_title(name)
         plt.axis('off')
         plt.show()
 
@@ -83,14 +81,30 @@ logging.basicConfig(filename=f'{task}.log',
                     level=logging.INFO, format=LOG_FORMAT)
 logging.getLogger('apscheduler').setLevel(logging.ERROR)
 logging.getLogger('lakeshore').setLevel(logging.ERROR)
-data_cache = []
+data_cache = RingBuffer(cache_num, columns[1:])
+last_data = None
+writer = Writer(path, task, name, columns)
+if save_store:
+    store = ColumnStore(path, task, name, columns)
 inst = DL7(instrument_ip)
 sched = BackgroundScheduler({'apscheduler.timezone': 'Asia/Shanghai'})
 sched.add_job(query, 'interval', seconds=interval, id='query')
+if metrics_port:
+    metrics.serve(metrics_port)
+    sched.add_listener(lambda event: metrics.failure(name), EVENT_JOB_ERROR)
+if timing_interval:
+    timing.enable()
+    timing.start_reporting(timing_interval)
 sched.start()
 logging.info(f'{name}, Start')
 plot()
 sched.shutdown()
+writer.close()
 inst.close()
+if save_store:
+    store.close()
+if timing_interval:
+    timing.stop_reporting()
+metrics.close()
 logging.info(f'{name}, Stop')
-recompress(path, task, name)
+recompress(path, task, name, background='process')
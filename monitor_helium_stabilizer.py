@@ -1,12 +1,16 @@
+import time
 import ctypes
 import logging
-import numpy as np
 from datetime import datetime
+from apscheduler.events import EVENT_JOB_ERROR
 from apscheduler.schedulers.background import BackgroundScheduler
 import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 
-from lib.data import recompress, save
+from lib import timing
+from lib.data import ColumnStore, Writer, recompress
+from lib.live_plot import LivePlot
+from lib.metrics import Metrics
+from lib.ring_buffer import RingBuffer
 from lib.helium_stabilizer import HeliumStabilizer
 
 
@@ -17,77 +21,61 @@ interval = 2  # unit is s
 plot_interval = 5  # unit is s
 cache_num = 600
 path = '.'
+save_store = True
+timing_interval = 0  # unit is s, > 0 logs the time of each stage of query() to the log
+metrics_port = None  # e.g. 9100, latest values and loop health on http://<this pc>:9100/metrics
 plot_data = True
 columns = [
     'Time', 'SV1', 'SV2', 'MANUAL_OR_AUTO', 'P1(bar)',
     'SETPOINT_A(bar)', 'SETPOINT_B(bar)', 'SETPOINT_C(bar)', 'COMPARE_PERIOD(ms)'
 ]
+store_dtypes = {'SV1': '<i4', 'SV2': '<i4', 'MANUAL_OR_AUTO': '<i4', 'COMPARE_PERIOD(ms)': '<i4'}
 timestamp_fmt = '%Y-%m-%d %H:%M:%S.%f'
+timer = timing.timer(name)
+metrics = Metrics(task.lower())
 
 
+@timer.timed('cycle')
 def query():
+    global last_data
+    t0 = time.perf_counter()
     t_now = datetime.now()
-    sv1 = inst.get_sv1()
-    sv2 = inst.get_sv2()
-    manual_or_auto = inst.get_manual_or_auto()
-    p1 = inst.get_pressure_1()
-    setpoint_a = inst.get_setpoint_a()
-    setpoint_b = inst.get_setpoint_b()
-    setpoint_c = inst.get_setpoint_c()
-    compare_period = inst.get_compare_period()
+    with timer.stage('query'):
+        snapshot = inst.snapshot()
 
     new_data = [
         t_now.strftime(timestamp_fmt),
-        sv1, sv2, manual_or_auto, p1,
-        setpoint_a, setpoint_b, setpoint_c,
-        compare_period
+        snapshot['sv1'], snapshot['sv2'], snapshot['manual_or_auto'], snapshot['pressure_1'],
+        snapshot['setpoint_a'], snapshot['setpoint_b'], snapshot['setpoint_c'],
+        snapshot['compare_period']
     ]
-    data_cache.append(new_data)
-    if len(data_cache) > cache_num:
-        data_cache.pop(0)
-    save(path, task, name, columns, new_data)
-    print(new_data)
+    last_data = new_data
+    data_cache.append(t_now.timestamp(), new_data[1:])
+    with timer.stage('write'):
+        writer.append(new_data)
+    if save_store:
+        with timer.stage('store'):
+            store.append(t_now, new_data[1:])
+    with timer.stage('print'):
+        print(new_data)
+    if metrics_port:
+        metrics.update(name, columns[1:], new_data[1:], t_now.timestamp(), time.perf_counter() - t0)
 
 
 def plot():
-    fig, ax1 = plt.subplots(figsize=(12/2.54, 9/2.54))
-    fig.canvas.manager.set_window_title(name)
     if plot_data:
-        axs = [ax1]
-        xlabel = 't(s)'
-        ylabels = ['P1(bar)']
-        styles = ['.-']
-        ax_gap = 55
-
-        colors = list(mcolors.TABLEAU_COLORS)
-        for i in range(len(axs)):
-            axs[i].spines['left'].set_color(colors[0])
-            axs[i].spines['right'].set_color(colors[i])
-            axs[i].tick_params(axis='y', color=colors[i], labelcolor=colors[i])
-            axs[i].spines['right'].set_position(
-                ('outward', ax_gap*(i-1) if i > 1 else 0))
-        plt.ion()
-        while plt.fignum_exists(1):
+        live_plot = LivePlot(name, ['P1(bar)'], ['.-'],
+                             figsize=(12/2.54, 9/2.54))
+        while live_plot.exists():
             if len(data_cache) > 0:
-                x = np.array([datetime.strptime(data[0], timestamp_fmt).timestamp()
-                              for data in data_cache])
-                x -= x[-1]
-                y = [np.array([data[4] for data in data_cache])]
-                title = f'{data_cache[-1][0]}\n{data_cache[-1][1:4]}\n{data_cache[-1][5:9]}'
-                for i in range(len(axs)):
-                    axs[i].cla()
-                    axs[i].plot(x, y[i], styles[i],
-                                c=colors[i], label=ylabels[i])
-                    axs[i].ticklabel_format(useOffset=False)
-                    axs[i].spines['right'].set_position(
-                        ('outward', ax_gap*(i-1) if i > 1 else 0))
-                ax1.set_xlabel(xlabel)
-                ax1.set_title(title)
-                fig.legend(loc=2, bbox_to_anchor=(0, 1),
-                           bbox_transform=ax1.transAxes, framealpha=0.1)
-                plt.tight_layout()
-            plt.pause(plot_interval)
+                x = data_cache.times() - data_cache.times()[-1]
+                y = [data_cache['P1(bar)']]
+                title = f'{last_data[0]}\n{last_data[1:4]}\n{last_data[5:9]}'
+                live_plot.update(x, y, title)
+            live_plot.pause(plot_interval)
     else:
+        fig = plt.figure(figsize=(12/2.54, 9/2.54))
+        fig.canvas.manager.set_window_title(name)
         plt.axis('off')
         plt.show()
 
@@ -98,7 +86,11 @@ logging.basicConfig(filename=f'{task}.log',
                     level=logging.INFO, format=LOG_FORMAT)
 logging.getLogger('apscheduler').setLevel(logging.ERROR)
 logging.getLogger('snap7').setLevel(logging.ERROR)
-data_cache = []
+data_cache = RingBuffer(cache_num, columns[1:], store_dtypes)
+last_data = None
+writer = Writer(path, task, name, columns)
+if save_store:
+    store = ColumnStore(path, task, name, columns, store_dtypes)
 inst = HeliumStabilizer(instrument_ip)
 inst.set_setpoint_a(1.03)
 inst.set_setpoint_b(1.04)
@@ -107,10 +99,22 @@ inst.set_compare_period(1000)
 inst.set_manual_or_auto(1)
 sched = BackgroundScheduler({'apscheduler.timezone': 'Asia/Shanghai'})
 sched.add_job(query, 'interval', seconds=interval, id='query')
+if metrics_port:
+    metrics.serve(metrics_port)
+    sched.add_listener(lambda event: metrics.failure(name), EVENT_JOB_ERROR)
+if timing_interval:
+    timing.enable()
+    timing.start_reporting(timing_interval)
 sched.start()
 logging.info(f'{name}, Start')
 plot()
 sched.shutdown()
+writer.close()
 inst.close()
+if save_store:
+    store.close()
+if timing_interval:
+    timing.stop_reporting()
+metrics.close()
 logging.info(f'{name}, Stop')
-recompress(path, task, name)
+recompress(path, task, name, background='process')
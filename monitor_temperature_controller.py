@@ -1,22 +1,34 @@
+import time
 import ctypes
 import logging
-import numpy as np
+from functools import partial
 from lakeshore import Model336
 from datetime import datetime
+from apscheduler.events import EVENT_JOB_ERROR
 from apscheduler.schedulers.background import BackgroundScheduler
 import matplotlib.pyplot as plt
-import matplotlib.colors as mcolors
 
-from lib.data import recompress, save
+from lib.config_cache import ConfigCache, MODEL336_SETTERS
+from lib import timing
+from lib.data import ColumnStore, Writer, recompress
+from lib.live_plot import LivePlot
+from lib.metrics import Metrics
+from lib.polling import MultiRatePoller
+from lib.ring_buffer import RingBuffer
 
 
 instrument_ip = '192.168.30.128'
 task = 'Cryostat'
 name = 'Temprature Controller'
-interval = 1  # unit is s
+interval = 1  # unit is s, temperatures, setpoints and heater outputs
+config_interval = 10  # unit is s, heater mode, pid, range and setup, a change shows up in the rows within it
+verify_interval = 60  # unit is s, heater mode, pid, range and setup are served from a shadow
 plot_interval = 5  # unit is s
 cache_num = 600
 path = '.'
+save_store = True
+timing_interval = 0  # unit is s, > 0 logs the time of each stage of query() to the log
+metrics_port = None  # e.g. 9100, latest values and loop health on http://<this pc>:9100/metrics
 plot_data = True
 columns = [
     'Time',
@@ -30,93 +42,90 @@ columns = [
     'OUTPUT 2 HEATER RANGE', 'OUTPUT 2 HEATER OUTPUT 1(%)',
     'OUTPUT 2 RESISTANCE', 'OUTPUT 2 MAX CURRENT(A)', 'OUTPUT 2 DISPLAY MODE'
 ]
+store_dtypes = {
+    c: '<i4' for c in columns
+    if c.endswith(('INPUT CHANNEL', 'HEATER RANGE', 'RESISTANCE', 'DISPLAY MODE'))
+}  # enum values
 timestamp_fmt = '%Y-%m-%d %H:%M:%S.%f'
+timer = timing.timer(name)
+metrics = Metrics(task.lower())
 
 
+@timer.timed('cycle')
 def query():
+    global last_data
+    t0 = time.perf_counter()
     t_now = datetime.now()
-    t1, t2, t3, t4, t5, t6, _, _ = inst.get_all_kelvin_reading()
-    output_mode_1 = inst.get_heater_output_mode(1)
-    setpoint_1 = inst.get_control_setpoint(1)
-    heater_pid_1 = inst.get_heater_pid(1)
-    heater_range_1 = inst.get_heater_range(1).name
-    heater_output_1 = inst.get_heater_output(1)
-    heater_setup_1 = inst.get_heater_setup(1)
-    output_mode_2 = inst.get_heater_output_mode(2)
-    setpoint_2 = inst.get_control_setpoint(2)
-    heater_pid_2 = inst.get_heater_pid(2)
-    heater_range_2 = inst.get_heater_range(2).name
-    heater_output_2 = inst.get_heater_output(2)
-    heater_setup_2 = inst.get_heater_setup(2)
+    with timer.stage('query'):
+        fields = poller.poll()
+    t1, t2, t3, t4, t5, t6, _, _ = fields['kelvin']
+    output_mode_1 = fields['heater_output_mode_1']
+    setpoint_1 = fields['control_setpoint_1']
+    heater_pid_1 = fields['heater_pid_1']
+    heater_range_1 = fields['heater_range_1']
+    heater_output_1 = fields['heater_output_1']
+    heater_setup_1 = fields['heater_setup_1']
+    output_mode_2 = fields['heater_output_mode_2']
+    setpoint_2 = fields['control_setpoint_2']
+    heater_pid_2 = fields['heater_pid_2']
+    heater_range_2 = fields['heater_range_2']
+    heater_output_2 = fields['heater_output_2']
+    heater_setup_2 = fields['heater_setup_2']
 
     new_data = [
         t_now.strftime(timestamp_fmt),
         t1, t2, t3, t4, t5, t6,
         output_mode_1['channel'].name, setpoint_1,
         heater_pid_1['gain'], heater_pid_1['integral'], heater_pid_1['ramp_rate'],
-        heater_range_1, heater_output_1,
+        heater_range_1.name, heater_output_1,
         heater_setup_1['heater_resistance'].name, heater_setup_1['max_current'], heater_setup_1['output_display_mode'].name,
         output_mode_2['channel'].name, setpoint_2,
         heater_pid_2['gain'], heater_pid_2['integral'], heater_pid_2['ramp_rate'],
-        heater_range_2, heater_output_2,
+        heater_range_2.name, heater_output_2,
         heater_setup_2['heater_resistance'].name, heater_setup_2['max_current'], heater_setup_2['output_display_mode'].name
     ]
-    data_cache.append(new_data)
-    if len(data_cache) > cache_num:
-        data_cache.pop(0)
-    save(path, task, name, columns, new_data)
-    print(new_data)
+    store_row = [
+        t1, t2, t3, t4, t5, t6,
+        output_mode_1['channel'].value, setpoint_1,
+        heater_pid_1['gain'], heater_pid_1['integral'], heater_pid_1['ramp_rate'],
+        heater_range_1.value, heater_output_1,
+        heater_setup_1['heater_resistance'].value, heater_setup_1['max_current'], heater_setup_1['output_display_mode'].value,
+        output_mode_2['channel'].value, setpoint_2,
+        heater_pid_2['gain'], heater_pid_2['integral'], heater_pid_2['ramp_rate'],
+        heater_range_2.value, heater_output_2,
+        heater_setup_2['heater_resistance'].value, heater_setup_2['max_current'], heater_setup_2['output_display_mode'].value
+    ]
+    last_data = new_data
+    data_cache.append(t_now.timestamp(), store_row)
+    with timer.stage('write'):
+        writer.append(new_data)
+    if save_store:
+        with timer.stage('store'):
+            store.append(t_now, store_row)
+    with timer.stage('print'):
+        print(new_data)
+    if metrics_port:
+        metrics.update(name, columns[1:], store_row, t_now.timestamp(), time.perf_counter() - t0)
 
 
 def plot():
-    fig, ax1 = plt.subplots(figsize=(30/2.54, 15/2.54))
-    fig.canvas.manager.set_window_title(name)
     if plot_data:
-        ax2 = ax1.twinx()
-        ax3 = ax1.twinx()
-        ax4 = ax1.twinx()
-        ax5 = ax1.twinx()
-        ax6 = ax1.twinx()
-        ax7 = ax1.twinx()
-        ax8 = ax1.twinx()
-        axs = [ax1, ax2, ax3, ax4, ax5, ax6, ax7, ax8]
-        xlabel = 't(s)'
-        ylabels = ['T1(K)', 'T2(K)', 'T3(K)', 'T4(K)', 'T5(K)',
-                   'T6(K)', 'OUTPUT1(%)', 'OUTPUT2(%)']
-        styles = ['.-', '.-', '.-', '.-', '.-',
-                  '.-', 'v', 's']
-        ax_gap = 55
-
-        colors = list(mcolors.TABLEAU_COLORS)
-        for i in range(len(axs)):
-            axs[i].spines['left'].set_color(colors[0])
-            axs[i].spines['right'].set_color(colors[i])
-            axs[i].tick_params(axis='y', color=colors[i], labelcolor=colors[i])
-            axs[i].spines['right'].set_position(
-                ('outward', ax_gap*(i-1) if i > 1 else 0))
-        plt.ion()
-        while plt.fignum_exists(1):
+        live_plot = LivePlot(name,
+                             ['T1(K)', 'T2(K)', 'T3(K)', 'T4(K)', 'T5(K)',
+                              'T6(K)', 'OUTPUT1(%)', 'OUTPUT2(%)'],
+                             ['.-', '.-', '.-', '.-', '.-',
+                              '.-', 'v', 's'],
+                             figsize=(30/2.54, 15/2.54))
+        while live_plot.exists():
             if len(data_cache) > 0:
-                x = np.array([datetime.strptime(data[0], timestamp_fmt).timestamp()
-                              for data in data_cache])
-                x -= x[-1]
-                y = [np.array([data[i] for data in data_cache])
-                     for i in list(range(1, 7))+[13, 23]]
-                title = f'{data_cache[-1][0]}\n{data_cache[-1][7:13]}\n{data_cache[-1][17:23]}'
-                for i in range(len(axs)):
-                    axs[i].cla()
-                    axs[i].plot(x, y[i], styles[i],
-                                c=colors[i], label=ylabels[i])
-                    axs[i].ticklabel_format(useOffset=False)
-                    axs[i].spines['right'].set_position(
-                        ('outward', ax_gap*(i-1) if i > 1 else 0))
-                ax1.set_xlabel(xlabel)
-                ax1.set_title(title)
-                fig.legend(loc=2, bbox_to_anchor=(0, 1),
-                           bbox_transform=ax1.transAxes, framealpha=0.1)
-                plt.tight_layout()
-            plt.pause(plot_interval)
+                x = data_cache.times() - data_cache.times()[-1]
+                y = [data_cache[columns[i]] for i in list(range(1, 7))+[13, 23]]
+                title = f'{last_data[0]}\n{last_data[7:13]}\n{last_data[17:23]}'
+                live_plot.update(x, y, title)
+            live_plot.pause(plot_interval)
     else:
+        fig = plt.figure(figsize=(30/2.54, 15/2.54))
+        fig.canvas.manager.set_window_title(name)
         plt.axis('off')
         plt.show()
 
@@ -127,14 +136,38 @@ logging.basicConfig(filename=f'{task}.log',
                     level=logging.INFO, format=LOG_FORMAT)
 logging.getLogger('apscheduler').setLevel(logging.ERROR)
 logging.getLogger('lakeshore').setLevel(logging.ERROR)
-data_cache = []
-inst = Model336(ip_address=instrument_ip)
+data_cache = RingBuffer(cache_num, columns[1:], store_dtypes)
+last_data = None
+writer = Writer(path, task, name, columns)
+if save_store:
+    store = ColumnStore(path, task, name, columns, store_dtypes)
+inst = ConfigCache(Model336(ip_address=instrument_ip), MODEL336_SETTERS, verify_interval)
+poller = MultiRatePoller({
+    'kelvin': (inst.get_all_kelvin_reading, interval),
+    **{f'heater_output_{ch}': (partial(inst.get_heater_output, ch), interval) for ch in (1, 2)},
+    **{f'control_setpoint_{ch}': (partial(inst.get_control_setpoint, ch), interval) for ch in (1, 2)},
+    **{f'{field}_{ch}': (partial(getattr(inst, f'get_{field}'), ch), config_interval)
+       for ch in (1, 2) for field in ['heater_output_mode', 'heater_pid', 'heater_range', 'heater_setup']}
+}, interval)
 sched = BackgroundScheduler({'apscheduler.timezone': 'Asia/Shanghai'})
 sched.add_job(query, 'interval', seconds=interval, id='query')
+if metrics_port:
+    metrics.serve(metrics_port)
+    sched.add_listener(lambda event: metrics.failure(name), EVENT_JOB_ERROR)
+if timing_interval:
+    timing.enable()
+    timing.start_reporting(timing_interval)
 sched.start()
 logging.info(f'{name}, Start')
 plot()
 sched.shutdown()
+writer.close()
+inst.stop()
 inst.disconnect_tcp()
+if save_store:
+    store.close()
+if timing_interval:
+    timing.stop_reporting()
+metrics.close()
 logging.info(f'{name}, Stop')
-recompress(path, task, name)
+recompress(path, task, name, background='process')
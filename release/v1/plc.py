@@ -3,11 +3,16 @@ import os
 import time
 import snap7
 import struct
-from snap7.type import Areas
+import ctypes
+from snap7.type import Areas, S7DataItem, WordLen
 from datetime import datetime, timedelta
 from apscheduler.schedulers.background import BackgroundScheduler
 
 
+SNAPSHOT_SPANS = [(Areas.MK, 3, 125), (Areas.PA, 0, 1)]  # M3 .. MD124, Q0
+SNAPSHOT_STRUCT = struct.Struct('>b96x5f4xfb')  # M3, MD100 .. MD116, MD124, Q0
+
+
 def check_setpoint_range(min_val: float, max_val: float):
     def decorator(func):
         def wrapper(self, val: float, *args, **kwargs):
@@ -25,6 +30,29 @@ class PLC():
 
     def close(self) -> None:
         self.__client.disconnect()
+
+    def snapshot(self) -> dict:  # every value in one read_multi_vars
+        items = (S7DataItem * len(SNAPSHOT_SPANS))()
+        buffers = []
+        for item, (area, start, size) in zip(items, SNAPSHOT_SPANS):
+            buffer = ctypes.create_string_buffer(size)
+            item.Area = ctypes.c_int32(area.value)
+            item.WordLen = ctypes.c_int32(WordLen.Byte.value)
+            item.Result = ctypes.c_int32(0)
+            item.DBNumber = ctypes.c_int32(0)
+            item.Start = ctypes.c_int32(start)
+            item.Amount = ctypes.c_int32(size)
+            item.pData = ctypes.cast(ctypes.pointer(buffer), ctypes.POINTER(ctypes.c_uint8))
+            buffers.append(buffer)
+        _, items = self.__client.read_multi_vars(items)
+        if any(item.Result for item in items):
+            raise RuntimeError('read_multi_vars failed')
+        M3, MD100, MD104, MD108, MD112, MD116, MD124, Q0 = SNAPSHOT_STRUCT.unpack(b''.join(x.raw for x in buffers))
+        return {
+            'sv1': 1 if Q0 & 1 else 0, 'sv2': 1 if Q0 >> 1 & 1 else 0, 'manual_or_auto': 1 if M3 & 1 else 0,
+            'p01': MD116, 'setpoint_a': MD100, 'setpoint_b': MD104, 'setpoint_c': MD108, 'setpoint_d': MD112,
+            't1': MD124
+        }
         
     def get_sv1(self) -> int:
         Q0 = struct.unpack('b', self.__client.read_area(Areas.PA, 0, 0, 1))[0]
@@ -112,18 +140,10 @@ class PLC():
 def query(inst: PLC, data_file: str) -> None:
     new_row = [datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')]
     
-    sv1 = inst.get_sv1()
-    sv2 = inst.get_sv2()
-    manual_or_auto = inst.get_manual_or_auto()
-    p01 = inst.get_p01()
-    setpoint_a = inst.get_setpoint_a()
-    setpoint_b = inst.get_setpoint_b()
-    setpoint_c = inst.get_setpoint_c()
-    setpoint_d = inst.get_setpoint_d()
-    t1 = inst.get_t1()
+    snapshot = inst.snapshot()
     
-    new_row += [sv1, sv2, manual_or_auto, p01]
-    new_row += [setpoint_a, setpoint_b, setpoint_c, setpoint_d, t1]
+    new_row += [snapshot['sv1'], snapshot['sv2'], snapshot['manual_or_auto'], snapshot['p01']]
+    new_row += [snapshot['setpoint_a'], snapshot['setpoint_b'], snapshot['setpoint_c'], snapshot['setpoint_d'], snapshot['t1']]
     
     print(new_row)
     with open(data_file, 'a', newline='', encoding='utf-8') as file:
@@ -43,13 +43,62 @@ class TC290:
             raise
         self.__ser = serial.Serial(port=port, baudrate=baudrate)
         self.__ser.timeout = 0.5
+        self.__owed = 0  # replies of a timed out batch
         
     def close(self) -> None:
         self.__ser.close()
         
+    def resync(self) -> None:
+        # before a request, reads the replies still owed by a timed out batch (timeout each) and drops pending input,
+        # so a late reply is never taken for the one of the next request
+        ser_timeout = self.__ser.timeout
+        deadline = time.monotonic() + ser_timeout * self.__owed
+        try:
+            while self.__owed and (remaining := deadline - time.monotonic()) > 0:
+                self.__ser.timeout = remaining
+                if self.__ser.readline().endswith(b'\n'):
+                    self.__owed -= 1
+        finally:
+            self.__ser.timeout = ser_timeout
+        self.__owed = 0
+        self.__ser.reset_input_buffer()
+
     def query(self, cmd:str) -> str:
+        self.resync()
         self.__ser.write(f'{cmd}\r\n'.encode())
         return self.__ser.readline().decode().strip()
+
+    def query_many(self, cmds:list[str]) -> list[str]:
+        # writes every command back-to-back and reads the replies in order under a deadline of the serial timeout
+        # per command, commands must reply
+        self.resync()
+        self.__ser.write(''.join(f'{cmd}\r\n' for cmd in cmds).encode())
+        deadline = time.monotonic() + self.__ser.timeout * len(cmds)
+        ser_timeout = self.__ser.timeout
+        replies, buf = [], b''
+        try:
+            while len(replies) < len(cmds):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.__owed = len(cmds) - len(replies)  # read by the next request
+                    raise TimeoutError(f'{len(replies)} of {len(cmds)} replies to {cmds}')
+                self.__ser.timeout = remaining
+                buf += self.__ser.read(max(1, self.__ser.in_waiting))
+                *lines, buf = buf.split(b'\n')
+                replies += [x.decode().strip() for x in lines]
+        finally:
+            self.__ser.timeout = ser_timeout
+        return replies
+    
+    def query_status(self) -> list[str]:  # KRDG? and the state of both outputs in one batch
+        cmds = ['KRDG?'] + [f'{x} {ch}' for ch in [1, 2] for x in ['SETP?', 'OUTMODE?', 'RANGE?', 'PID?', 'HTR?', 'HTRSET?']]
+        replies = self.query_many(cmds)
+        status = replies[0].split(',')
+        for ch in [0, 1]:
+            set_value, output_parameters, output_range, pid, percentage, heating_output_parameters = replies[1+6*ch:7+6*ch]
+            status += [set_value] + output_parameters.split(',')[:3] + [output_range] + pid.split(',')
+            status += [percentage] + heating_output_parameters.split(',')
+        return status
     
     def query_idn(self) -> str:
         return self.query('*IDN?')
@@ -100,14 +149,7 @@ class TC290:
 
 def query(inst:TC290, data_file:str) -> None:
     new_row = [datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f')]
-    new_row += inst.query_kelvin_temperature_value()
-    for ch in [1, 2]:
-        new_row += [inst.query_control_loop_setpoint(output_channel=ch)]
-        new_row += inst.query_output_parameters(output_channel=ch)
-        new_row += [inst.query_output_range(output_channel=ch)]
-        new_row += inst.query_temperature_control_pid_parameters(output_channel=ch)
-        new_row += [inst.query_heating_output(temperature_control_channel=ch)]
-        new_row += inst.query_heating_output_parameters(temperature_control_channel=ch)
+    new_row += inst.query_status()
     print(new_row)
     with open(data_file, 'a', newline='', encoding='utf-8') as file:
         csv.writer(file).writerow(new_row)